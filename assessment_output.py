@@ -1,9 +1,7 @@
-import assessment_sensitivity
-import pandas as pd
+import parallel_regions
+import model_factory
 
-flumevale_pd = assessment_sensitivity.find_assessment_sensitivity_region("dam_data_imputed_flumevale.csv", False, True)
-lyndrassia_pd = assessment_sensitivity.find_assessment_sensitivity_region("dam_data_imputed_lyndrassia.csv", False, True)
-navaldia_pd = assessment_sensitivity.find_assessment_sensitivity_region("dam_data_imputed_navaldia.csv", False, True)
-
-output_no_replace = pd.concat([flumevale_pd, lyndrassia_pd, navaldia_pd])
-output_no_replace.to_excel("assessmentVSdecreaselossReplaceSOME.xlsx")
\ No newline at end of file
+if __name__ == "__main__":
+    #each region runs in its own worker process, the reported figures come from the final profile, the ydf defaults
+    output_no_replace = parallel_regions.assessment_sensitivity_regions(["dam_data_imputed_flumevale.csv", "dam_data_imputed_lyndrassia.csv", "dam_data_imputed_navaldia.csv"], [False], True, profile=model_factory.FINAL_PROFILE)
+    output_no_replace.to_excel("assessmentVSdecreaselossReplaceSOME.xlsx")
@@ -1,82 +1,134 @@
+#ydf and matplotlib are not imported here, the model comes from model_factory and the charts from plotting
+from __future__ import annotations
+from typing import TYPE_CHECKING
 import pandas as pd
 import numpy as np
-import ydf
-import matplotlib.pyplot as plot
-import math
-import scipy.stats
 import gov_expenditure
+import model_factory
+import loss_simulation
+import bootstrap
+import incremental_scoring
+import instrumentation
+import plotting
+import portfolio
+if TYPE_CHECKING:
+    import ydf
 
-def train_model(df : pd.DataFrame):
-    train_df = df.copy(True).drop(columns=["ID", "Years Modified", "Assessment Date", "Assessment Date","Loss given failure - prop (Qm)","Loss given failure - liab (Qm)", "Loss given failure - BI (Qm)", "Total Loss Given Failure", "Expected Loss Value", "Hazard"])
-    model = ydf.GradientBoostedTreesLearner(label="Probability of Failure", task=ydf.Task.REGRESSION).train(train_df)
+#columns that are not used to predict the probability of failure, see machine_learning for the reasoning
+DROPPED_COLUMNS = ["ID", "Years Modified", "Assessment Date", "Loss given failure - prop (Qm)", "Loss given failure - liab (Qm)", "Loss given failure - BI (Qm)", "Total Loss Given Failure", "Expected Loss Value", "Hazard"]
+#assessment levels swept by find_assessment_sensitivity_region
+ASSESSMENTS = ["Poor", "Unsatisfactory", "Fair", "Satisfactory"]
+#assessments that get replaced when replace_all is False
+UNRATED_ASSESSMENTS = ["Not Rated", "Not Available"]
+
+def train_model(df : pd.DataFrame, profile : str = model_factory.FINAL_PROFILE):
+    #reuses the stored model when this data has been trained on with this profile before
+    model = model_factory.train(df, DROPPED_COLUMNS, profile)
     #returns model
     return model
 
-def predict_model(file : str, model : ydf.GenericModel, assessment : str, replace_all : bool):
-    df = pd.read_csv(file)
-    test_df = df.copy(False).drop(columns=["ID", "Years Modified", "Assessment Date", "Assessment Date","Loss given failure - prop (Qm)","Loss given failure - liab (Qm)", "Loss given failure - BI (Qm)", "Total Loss Given Failure", "Expected Loss Value", "Hazard"])
+def scenario_features(df : pd.DataFrame, assessments : list, replace_all : bool) -> pd.DataFrame:
+    #stacks one copy of the feature frame per assessment level, block i has its assessment set to assessments[i]
+    features = df.drop(columns=DROPPED_COLUMNS)
+    stacked = pd.concat([features] * len(assessments), ignore_index=True)
+    replacement = np.repeat(np.asarray(assessments, dtype=object), len(features))
     if replace_all:
-        for i in range(len(test_df)):
-            test_df.loc[i, "Assessment"] = assessment
-        print("\n\n Replaced_ALL \n\n")
+        stacked["Assessment"] = replacement
+    else:
+        unrated = stacked["Assessment"].isin(UNRATED_ASSESSMENTS).to_numpy()
+        stacked["Assessment"] = np.where(unrated, replacement, stacked["Assessment"].to_numpy(dtype=object))
+    return stacked
+
+def assessment_variants(baseline : dict, assessments : list, replace_all : bool) -> list:
+    #(rows, features) per assessment level holding only the dams whose assessment actually changes
+    current = baseline["features"]["Assessment"].to_numpy(dtype=object)
+    unrated = np.flatnonzero(np.isin(current, UNRATED_ASSESSMENTS))
+    variants = []
+    for assessment in assessments:
+        rows = np.flatnonzero(current != assessment) if replace_all else unrated
+        features = baseline["features"].iloc[rows].copy()
+        features["Assessment"] = assessment
+        variants.append((rows, features))
+    return variants
+
+def predict_assessment_scenarios(df : pd.DataFrame, model : ydf.GenericModel, assessments : list = ASSESSMENTS, replace_all : bool = False, baseline : dict = None) -> pd.DataFrame:
+    #one model.predict over every scenario, returns "Probability of Failure <assessment>" and "Expected Loss Value <assessment>" columns
+    #with a baseline from incremental_scoring.baseline_scores only the changed dams are predicted and spliced into it
+    if baseline is None:
+        features = scenario_features(df, assessments, replace_all)
+        with instrumentation.span("ydf.predict", rows=len(features), variants=len(assessments)):
+            probabilities = np.asarray(model.predict(features, num_threads=model_factory.thread_count())).reshape(len(assessments), len(df))
+        instrumentation.count("ydf.rows_predicted", len(features))
     else:
-        for i in range(len(test_df)):
-            if test_df.loc[i, "Assessment"] == "Not Rated" or test_df.loc[i, "Assessment"] == "Not Available":
-                test_df.loc[i, "Assessment"] = assessment
-    new_probabilities = model.predict(test_df)
-    new_df = df.copy(True)
-    new_df["Probability of Failure"] = pd.Series(new_probabilities)
-    for i in range(new_df.index.size):
-        new_df.loc[i, "Expected Loss Value"] = new_df.loc[i, "Probability of Failure"] * new_df.loc[i, "Total Loss Given Failure"] 
-    #returns new file name
-    new_df.to_csv(f"machine_learning_assessment_adjusted_{df.loc[0, "Region"]}_Replaced_All_is_{replace_all}.csv", index = False)
+        variants = assessment_variants(baseline, assessments, replace_all)
+        changed = incremental_scoring.score_variants(baseline, variants)
+        probabilities = [incremental_scoring.splice(baseline, rows, new_probability) for (rows, _), new_probability in zip(variants, changed)]
+    total_loss = df["Total Loss Given Failure"].to_numpy()
+    scenarios = {}
+    for i, assessment in enumerate(assessments):
+        scenarios[f"Probability of Failure {assessment}"] = probabilities[i]
+        scenarios[f"Expected Loss Value {assessment}"] = probabilities[i] * total_loss
+    return pd.DataFrame(scenarios, index=df.index)
+
+def scenario_frame(df : pd.DataFrame, scenarios : pd.DataFrame, assessment : str) -> pd.DataFrame:
+    #the original data with one scenario's predictions swapped in, every other column is shared with df instead of copied
+    new_df = df.copy(deep=False)
+    new_df["Probability of Failure"] = scenarios[f"Probability of Failure {assessment}"].to_numpy()
+    new_df["Expected Loss Value"] = scenarios[f"Expected Loss Value {assessment}"].to_numpy()
     return new_df
 
-def draw_graph_And_statistics(old_df : pd.DataFrame, new_df : pd.DataFrame, export : bool, replace_all : bool, assessment : str):
+def adjusted_file(df : pd.DataFrame, replace_all : bool) -> str:
+    #default name for exporting a scenario frame
+    return f"machine_learning_assessment_adjusted_{df['Region'].iloc[0]}_Replaced_All_is_{replace_all}.csv"
+
+def predict_model(data, model : ydf.GenericModel, assessment : str, replace_all : bool, export_file : str = None):
+    #data is a csv path or a DataFrame, the scenario frame is only written when export_file is given
+    df = gov_expenditure.load_frame(data)
+    new_df = scenario_frame(df, predict_assessment_scenarios(df, model, [assessment], replace_all), assessment)
+    if export_file is not None:
+        with instrumentation.span("csv.write", file=export_file):
+            new_df.to_csv(export_file, index = False)
+    return new_df
+
+def draw_graph_And_statistics(old_df : pd.DataFrame, new_df : pd.DataFrame, export : bool, replace_all : bool, assessment : str, method : str = "normal", bins : dict = None):
+    #the histogram is queued on plotting's background pool, the statistics do not wait for it
+    #bins from plotting.shared_bins give every assessment of the region the same bin edges
+    gov_expenditure.check_method(method)
+    region = old_df["Region"].iloc[0]
     compare_new = new_df["Expected Loss Value"].to_numpy()
     compare_old = old_df["Expected Loss Value"].to_numpy()
-    plot.hist([compare_old, compare_new], bins=50,label=["Original", "After Frequency Change"])
-    plot.xlabel("Expected Loss Value, millions(£Q)")
-    plot.ylabel("Number of Dams")
-    plot.title(f"Reduction to losses by change in assessment in {old_df.loc[0, "Region"]}")
-    plot.legend()
-    if export:
-        plot.savefig(f"assessment_adjusted_expected_loss__{old_df.loc[0, "Region"]}_histogram_{assessment}_Replaced_All_is_{replace_all}.png")
-    plot.clf()
+    plotting.assessment_histogram(compare_old, compare_new, region, assessment, replace_all, export, bins)
 
-    new_data = gov_expenditure.yearly_loss_percentile(f"machine_learning_assessment_adjusted_{old_df.loc[0, "Region"]}_Replaced_All_is_{replace_all}.csv", 0, 100, False)
-    old_data = gov_expenditure.yearly_loss_percentile("dam_data_imputed_flumevale.csv", 0, 100, False)
-    gov_threshold = scipy.stats.norm.ppf(95/100) * old_data[2] + old_data[1] #one standard deviation, covers 95% to 99.7% of all cases
-    gov_reserve = scipy.stats.norm.ppf(0.997) * old_data[2] + old_data[1] - gov_threshold
-    new__gov_detachment_point = scipy.stats.norm.ppf(0.997) * new_data[2] + new_data[1] #the amount of money for 99.7% of all cases
-    new_gov_threshold = new__gov_detachment_point - gov_reserve
-    new_percentile = scipy.stats.norm.cdf(new_gov_threshold, new_data[1], new_data[2])
-    if True:
-        print("Based on the original data, the threshold should be:", gov_threshold, "and the reserve is", gov_reserve)
-        print(f"The expected value of the new data is {new_data[1]} with standard deviation {new_data[2]}.")
-        print(f"This means the government detachment point is {new__gov_detachment_point} and the detachment point is {new_gov_threshold}.")
-        print(f"The insurance companies will expect to pay {new_data[1]} instead of {old_data[1]}. This represents a decreased payout of {new_data[1] - old_data[1]}")
-        print(f"The government threshold will also shift by {new_gov_threshold - gov_threshold}")
-        print(f"This is the {new_percentile * 100} percentile.")
+    #both frames are already in memory, nothing is written or read back
+    if method == "simulation":
+        return loss_simulation.simulated_threshold_statistics(loss_simulation.frame_simulation(old_df), loss_simulation.frame_simulation(new_df), 95, region, True)
+    if method == "bootstrap":
+        return bootstrap.frame_bootstrap(old_df, new_df, 95, region, True)
+    new_data = gov_expenditure.yearly_moments(new_df)
+    old_data = gov_expenditure.yearly_moments(old_df)
+    return gov_expenditure.threshold_statistics(old_data, new_data, 95, region, True)
 
-    ans = {f"Threshold percent {old_df.loc[0,"Region"]}" : new_percentile}
-    ans.update({f"Original Threshold {old_df.loc[0,"Region"]}": gov_threshold})
-    ans.update({f"New Threshold {old_df.loc[0,"Region"]}" : new_gov_threshold})
-    ans.update({f"Change in Threshold {old_df.loc[0,"Region"]}" : new_gov_threshold - gov_threshold})
-    ans.update({f"Original Expected Payout {old_df.loc[0,"Region"]}" : old_data[1]})
-    ans.update({f"New Expected Payout {old_df.loc[0,"Region"]}" : new_data[1]})
-    ans.update({f"Change in Payout {old_df.loc[0,"Region"]}" : new_data[1] - old_data[1]})
-    return ans
-
-def find_assessment_sensitivity_region(file : str, replace_all : bool, export : bool):
-    old_df = pd.read_csv(file)
-    model = train_model(old_df)
-    new_df = predict_model(file, model, "Poor", replace_all)
-    ans = pd.DataFrame([draw_graph_And_statistics(old_df, new_df, export, replace_all, "Poor")])
-    new_df = predict_model(file, model, "Unsatisfactory", replace_all)
-    ans = pd.concat([ans, pd.DataFrame([draw_graph_And_statistics(old_df, new_df, export, replace_all, "Unsatisfactory")])])
-    new_df = predict_model(file, model, "Fair", replace_all)
-    ans = pd.concat([ans, pd.DataFrame([draw_graph_And_statistics(old_df, new_df, export, replace_all, "Fair")])])
-    new_df = predict_model(file, model, "Satisfactory", replace_all)
-    ans = pd.concat([ans, pd.DataFrame([draw_graph_And_statistics(old_df, new_df, export, replace_all, "Satisfactory")])])
-    return ans
\ No newline at end of file
+def find_assessment_sensitivity_region(data, replace_all : bool, export : bool, assessments : list = ASSESSMENTS, export_csv : bool = False, method : str = "normal", profile : str = model_factory.FINAL_PROFILE):
+    #data is a csv path or a DataFrame, export writes the histograms and export_csv the adjusted frames
+    #method="simulation" replaces the normal approximation with loss_simulation, method="bootstrap" adds bootstrap confidence intervals to it
+    #profile picks the model_factory training profile, the ydf defaults unless EXPLORATORY_PROFILE is passed for a quicker sweep
+    gov_expenditure.check_method(method)
+    old_df = gov_expenditure.load_frame(data)
+    model = train_model(old_df, profile)
+    #the scenarios run on the compact dtypes, each scenario frame only adds its two predicted columns
+    old_df = portfolio.compact_frame(old_df)
+    #unchanged dams keep their baseline prediction, only the re-assessed dams are scored per level
+    baseline = incremental_scoring.baseline_scores(old_df, model, DROPPED_COLUMNS, model_factory.thread_count())
+    scenarios = predict_assessment_scenarios(old_df, model, assessments, replace_all, baseline)
+    bins = None
+    if export:
+        bins = plotting.shared_bins(old_df["Expected Loss Value"].to_numpy(), [scenarios[f"Expected Loss Value {assessment}"].to_numpy() for assessment in assessments])
+    ans = []
+    for assessment in assessments:
+        new_df = scenario_frame(old_df, scenarios, assessment)
+        if export_csv:
+            export_file = adjusted_file(old_df, replace_all)
+            with instrumentation.span("csv.write", file=export_file):
+                new_df.to_csv(export_file, index = False)
+        ans.append(draw_graph_And_statistics(old_df, new_df, export, replace_all, assessment, method, bins))
+    return pd.DataFrame(ans)
@@ -0,0 +1,176 @@
+#stage level benchmarks for the loss and sensitivity pipeline
+#every stage runs on the bundled region files and on scaled up synthetic copies of them, recording wall time, peak python heap and rows per second
+#the wall time comes from untraced runs, the heap peak from one extra run under tracemalloc, which slows allocation heavy stages down
+#and does not see ydf's or numpy's native allocations
+#results are saved as json and compared against a stored baseline so slowdowns show up as regressions
+#usage: python benchmark.py --scales 1 4 --output benchmark_results.json --baseline benchmark_baseline.json
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+REGION_FILES = {
+    "Flumevale" : ("dam_data_imputed_flumevale.csv", "dam_data_flumevale.csv"),
+    "Lyndrassia" : ("dam_data_imputed_lyndrassia.csv", "dam_data_lyndrassia.csv"),
+    "Navaldia" : ("dam_data_imputed_navaldia.csv", "dam_data_navaldia.csv"),
+}
+STAGES = ["csv_load", "train", "predict", "moments", "histogram", "imputation"]
+#a stage is flagged when it is this much slower than the baseline
+REGRESSION_THRESHOLD = 0.25
+
+def scale_frame(df : pd.DataFrame, factor : int, seed : int = 0) -> pd.DataFrame:
+    #synthetic registry with factor times the rows: dams resampled with replacement, measurements jittered by up to 5% and fresh IDs
+    if factor == 1:
+        return df
+    rng = np.random.default_rng(seed)
+    scaled = df.iloc[rng.integers(0, len(df), len(df) * factor)].reset_index(drop=True)
+    for column in ["Height (m)", "Length (km)", "Volume (m3)", "Surface (km2)", "Drainage (km2)", "Distance to Nearest City (km)"]:
+        if column in scaled.columns:
+            scaled[column] = scaled[column] * rng.uniform(0.95, 1.05, len(scaled))
+    scaled["ID"] = [f"SYN{i:08d}" for i in range(len(scaled))]
+    return scaled
+
+def measure(function, rows : int, repeat : int = 1) -> dict:
+    #best wall time over repeat untraced runs, then the peak python heap of one more run under tracemalloc
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    wall = min(times)
+    return {"wall_seconds" : wall, "python_heap_peak_bytes" : peak, "rows" : rows, "rows_per_second" : rows / wall if wall > 0 else None}
+
+def _stage_functions(imputed_df : pd.DataFrame, raw_df : pd.DataFrame, csv_file : str, directory : str, profiles : list) -> dict:
+    #train has one function per model_factory profile, the other model stages use the final profile like the reported outputs
+    import ydf
+    import assessment_sensitivity
+    import dam_dataset
+    import gov_expenditure
+    import imputation
+    import model_factory
+    import model_store
+    import plotting
+
+    ydf.verbose(0)
+    model = model_factory.train(imputed_df, assessment_sensitivity.DROPPED_COLUMNS, model_factory.FINAL_PROFILE, directory=os.path.join(directory, "models"))
+    scenarios = assessment_sensitivity.predict_assessment_scenarios(imputed_df, model, assessment_sensitivity.ASSESSMENTS, False)
+    new_df = assessment_sensitivity.scenario_frame(imputed_df, scenarios, "Fair")
+    train_directory = os.path.join(directory, "train")
+
+    def train(profile : str):
+        #a fresh store every run so the stage always pays for training
+        def run():
+            model_store.invalidate(None, train_directory)
+            model_factory.train(imputed_df, assessment_sensitivity.DROPPED_COLUMNS, profile, directory=train_directory)
+        return run
+
+    def histogram():
+        current = os.getcwd()
+        os.chdir(directory)
+        try:
+            assessment_sensitivity.draw_graph_And_statistics(imputed_df, new_df, True, False, "Fair")
+            #the chart is rendered in the background, the stage includes waiting for the png
+            plotting.wait()
+        finally:
+            os.chdir(current)
+
+    return {
+        "csv_load" : (lambda: pd.read_csv(csv_file), lambda: dam_dataset.load_dam_data(csv_file, directory=os.path.join(directory, "cache"))),
+        "train" : {profile : train(profile) for profile in profiles},
+        "predict" : lambda: assessment_sensitivity.predict_assessment_scenarios(imputed_df, model, assessment_sensitivity.ASSESSMENTS, False),
+        "moments" : lambda: gov_expenditure.yearly_moments(new_df),
+        "histogram" : histogram,
+        "imputation" : lambda: imputation.impute_dam_data(raw_df, processes=1),
+    }
+
+def run_benchmarks(regions : list = list(REGION_FILES), scales : list = [1], stages : list = STAGES, repeat : int = 1, profiles : list = None) -> dict:
+    #profiles defaults to the exploratory and the final model_factory profile
+    import model_factory
+    profiles = profiles or [model_factory.EXPLORATORY_PROFILE, model_factory.FINAL_PROFILE]
+    results = {"machine" : {"python" : platform.python_version(), "processor" : platform.processor(), "cpus" : os.cpu_count()}, "created" : time.time(), "stages" : {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for region in regions:
+            imputed_file, raw_file = REGION_FILES[region]
+            imputed_base = pd.read_csv(imputed_file)
+            raw_base = pd.read_csv(raw_file)
+            for scale in scales:
+                imputed_df = scale_frame(imputed_base, scale)
+                raw_df = scale_frame(raw_base, scale)
+                csv_file = os.path.join(directory, f"{region}_{scale}.csv")
+                imputed_df.to_csv(csv_file, index=False)
+                functions = _stage_functions(imputed_df, raw_df, csv_file, directory, profiles)
+                for stage in stages:
+                    rows = len(raw_df) if stage == "imputation" else len(imputed_df)
+                    if stage == "csv_load":
+                        parse, cached = functions[stage]
+                        results["stages"][f"{stage}/csv/{region}/x{scale}"] = measure(parse, rows, repeat)
+                        cached()
+                        results["stages"][f"{stage}/cache/{region}/x{scale}"] = measure(cached, rows, repeat)
+                    elif stage == "train":
+                        for profile, train in functions[stage].items():
+                            results["stages"][f"{stage}/{profile}/{region}/x{scale}"] = measure(train, rows, repeat)
+                    else:
+                        results["stages"][f"{stage}/{region}/x{scale}"] = measure(functions[stage], rows, repeat)
+                    print(f"Finished {stage} for {region} x{scale} ...")
+    return results
+
+def compare(results : dict, baseline : dict, threshold : float = REGRESSION_THRESHOLD) -> list:
+    #returns one row per stage present in both runs, regression is True when the wall time grew by more than threshold
+    rows = []
+    for key, current in results["stages"].items():
+        if key not in baseline["stages"]:
+            continue
+        previous = baseline["stages"][key]["wall_seconds"]
+        ratio = current["wall_seconds"] / previous if previous > 0 else float("inf")
+        rows.append({"stage" : key, "baseline_seconds" : previous, "seconds" : current["wall_seconds"], "ratio" : ratio, "regression" : ratio > 1 + threshold})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Stage level benchmarks for the dam loss pipeline")
+    parser.add_argument("--regions", nargs="+", default=list(REGION_FILES), choices=list(REGION_FILES))
+    parser.add_argument("--scales", nargs="+", type=int, default=[1])
+    parser.add_argument("--stages", nargs="+", default=STAGES, choices=STAGES)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--profiles", nargs="+", default=None, help="model_factory profiles to time training for")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    parser.add_argument("--update-baseline", action="store_true", help="store this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.regions, args.scales, args.stages, args.repeat, args.profiles)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved results to '{args.output}'")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved baseline to '{args.baseline}'")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at '{args.baseline}', run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    comparison = pd.DataFrame(compare(results, baseline, args.threshold))
+    print(comparison.to_string(index=False))
+    regressions = comparison[comparison["regression"]] if not comparison.empty else comparison
+    if not regressions.empty:
+        print(f"{len(regressions)} stage(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,79 @@
+#bootstrap confidence intervals for the threshold and payout changes of gov_expenditure.threshold_statistics
+#every replicate resamples the region's dams with replacement and recomputes the yearly_loss_percentile moments
+#before and after the policy change on the same resampled dams, so the intervals show how much the change depends on which dams are in the portfolio
+#replicates are drawn as index matrices and reduced in batches with numpy, batches can be spread over processes
+#every batch has its own seed spawned from seed, so the intervals do not depend on the number of processes
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import gov_expenditure
+
+REPLICATES = 2000
+CONFIDENCE = 0.95
+#upper bound on the replicate x dam index matrix of one batch
+BATCH_CELLS = 4_000_000
+
+def replicate_indices(rng : np.random.Generator, dams : int, replicates : int) -> np.ndarray:
+    #replicates x dams matrix of dam indices drawn with replacement
+    return rng.integers(0, dams, size=(replicates, dams), dtype=np.intp if dams > np.iinfo(np.int32).max else np.int32)
+
+def replicate_moments(probability : np.ndarray, total_loss : np.ndarray, indices : np.ndarray, lower_percentile : float = 0, upper_percentile : float = 100) -> tuple:
+    #yearly_tuple of every replicate as arrays (total_loss, expected_value, standard_deviation, variance, count)
+    #the band is the [lower_percentile, upper_percentile) slice of each replicate's dams sorted by expected loss, like portfolio_moments
+    expected = probability * total_loss
+    variance_terms = probability * total_loss * total_loss - expected * expected
+    if (lower_percentile, upper_percentile) != (0, 100):
+        #one sort per replicate row, then every replicate keeps the same slice of its own order
+        order = np.argsort(expected[indices], axis=1, kind="stable")
+        lower_bound, upper_bound = gov_expenditure.band_bounds(indices.shape[1], lower_percentile, upper_percentile)
+        indices = np.take_along_axis(indices, order[:, lower_bound:upper_bound], axis=1)
+    variance = variance_terms[indices].sum(axis=1) / 10
+    return total_loss[indices].sum(axis=1), expected[indices].sum(axis=1) / 10, np.sqrt(variance), variance, np.full(indices.shape[0], indices.shape[1])
+
+def _batch(old_probability : np.ndarray, new_probability : np.ndarray, total_loss : np.ndarray, replicates : int, seed : np.random.SeedSequence, initial_percentile : float, lower_percentile : float, upper_percentile : float) -> dict:
+    #threshold_statistics of one batch of replicates, the statistics are evaluated on whole arrays at once
+    indices = replicate_indices(np.random.default_rng(seed), total_loss.size, replicates)
+    old_data = replicate_moments(old_probability, total_loss, indices, lower_percentile, upper_percentile)
+    new_data = replicate_moments(new_probability, total_loss, indices, lower_percentile, upper_percentile)
+    return gov_expenditure.threshold_statistics(old_data, new_data, initial_percentile, "", False)
+
+def replicate_statistics(old_probability : np.ndarray, new_probability : np.ndarray, total_loss : np.ndarray, initial_percentile : float = 95, replicates : int = REPLICATES, seed : int = 0, processes : int = 1, lower_percentile : float = 0, upper_percentile : float = 100) -> dict:
+    #{statistic: array of its value in every replicate}, statistics named like threshold_statistics without the region
+    old_probability = np.asarray(old_probability, dtype=np.float64)
+    new_probability = np.asarray(new_probability, dtype=np.float64)
+    total_loss = np.asarray(total_loss, dtype=np.float64)
+    step = max(1, BATCH_CELLS // max(total_loss.size, 1))
+    sizes = [min(step, replicates - start) for start in range(0, replicates, step)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    arguments = [(old_probability, new_probability, total_loss, size, batch_seed, initial_percentile, lower_percentile, upper_percentile) for size, batch_seed in zip(sizes, seeds)]
+    if processes <= 1 or len(sizes) <= 1:
+        batches = [_batch(*argument) for argument in arguments]
+    else:
+        with ProcessPoolExecutor(max_workers=min(processes, len(sizes))) as executor:
+            batches = list(executor.map(_batch, *zip(*arguments)))
+    return {key.strip() : np.concatenate([np.atleast_1d(batch[key]) for batch in batches]) for key in batches[0]}
+
+def with_intervals(statistics : dict, replicates : dict, region : str, confidence : float = CONFIDENCE) -> dict:
+    #statistics with "<key> low" and "<key> high" percentile bounds placed right after every key
+    lower_quantile = (1 - confidence) / 2
+    result = {}
+    for key, value in statistics.items():
+        result[key] = value
+        values = replicates[key[:-len(region)].strip() if region and key.endswith(region) else key]
+        low, high = np.nanquantile(values, [lower_quantile, 1 - lower_quantile])
+        result[f"{key} low"] = float(low)
+        result[f"{key} high"] = float(high)
+    return result
+
+def bootstrap_threshold_statistics(old_probability : np.ndarray, new_probability : np.ndarray, total_loss : np.ndarray, initial_percentile : float, region : str, verbose : bool = False, replicates : int = REPLICATES, confidence : float = CONFIDENCE, seed : int = 0, processes : int = 1) -> dict:
+    #threshold_statistics of the whole portfolio with a percentile confidence interval next to every value
+    old_data = gov_expenditure.yearly_tuple(gov_expenditure.portfolio_moments(old_probability, total_loss))
+    new_data = gov_expenditure.yearly_tuple(gov_expenditure.portfolio_moments(new_probability, total_loss))
+    statistics = gov_expenditure.threshold_statistics(old_data, new_data, initial_percentile, region, verbose)
+    return with_intervals(statistics, replicate_statistics(old_probability, new_probability, total_loss, initial_percentile, replicates, seed, processes), region, confidence)
+
+def frame_bootstrap(old_df, new_df, initial_percentile : float, region : str, verbose : bool = False, replicates : int = REPLICATES, confidence : float = CONFIDENCE, seed : int = 0, processes : int = 1) -> dict:
+    #bootstrap_threshold_statistics of a dam_data frame before and after a policy change, the frames hold the same dams in the same order
+    #the point estimates are exactly those of yearly_moments on the frames
+    statistics = gov_expenditure.threshold_statistics(gov_expenditure.yearly_moments(old_df), gov_expenditure.yearly_moments(new_df), initial_percentile, region, verbose)
+    samples = replicate_statistics(old_df["Probability of Failure"].to_numpy(), new_df["Probability of Failure"].to_numpy(), old_df["Total Loss Given Failure"].to_numpy(), initial_percentile, replicates, seed, processes)
+    return with_intervals(statistics, samples, region, confidence)
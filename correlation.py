@@ -0,0 +1,178 @@
+#pearson and spearman correlation matrices of a dam registry, per region and for the pooled registry
+#categorical columns are encoded to numbers first, ordered ones by their order, the rest by their category codes
+#every matrix comes from a few matrix products over the whole column block instead of one pass per pair:
+#missing values are masked out pairwise, spearman is pearson on the ranks of each column within the group,
+#re-ranked over the common rows for the pairs of columns whose missing rows differ
+import numpy as np
+import pandas as pd
+from dam_dataset import CATEGORICAL_COLUMNS
+
+METHODS = ["pearson", "spearman"]
+#levels in increasing order, other levels (Not Rated, Not Available, Undetermined) count as missing
+ORDINAL_ORDERS = {
+    "Regulated Dam" : ["No", "Yes"],
+    "Spillway" : ["Uncontrolled", "Controlled"],
+    "Hazard" : ["Low", "Significant", "High"],
+    "Assessment" : ["Poor", "Unsatisfactory", "Fair", "Satisfactory"],
+}
+#points drawn in a scatter plot, more only slows the rendering down
+SAMPLE_SIZE = 5_000
+
+def encode(df : pd.DataFrame, by : str = "Region", orders : dict = ORDINAL_ORDERS) -> pd.DataFrame:
+    #float64 frame of every numeric and categorical column except by, missing values are nan
+    #categorical columns without an order get their (alphabetical) category codes, so only their spread is meaningful, not the sign
+    columns = {}
+    for name in df.columns:
+        values = df[name]
+        if name == by:
+            continue
+        if name in orders:
+            codes = pd.Categorical(values, categories=orders[name]).codes
+        elif name in CATEGORICAL_COLUMNS or isinstance(values.dtype, pd.CategoricalDtype):
+            codes = pd.Categorical(values).codes
+        elif pd.api.types.is_numeric_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+            columns[name] = values.to_numpy(dtype=np.float64)
+            continue
+        else:
+            continue
+        columns[name] = np.where(codes < 0, np.nan, codes).astype(np.float64)
+    return pd.DataFrame(columns)
+
+def ranks(values : np.ndarray) -> np.ndarray:
+    #average ranks (1 based) of every column of a rows x columns array, ties share their mean rank and nan stays nan
+    #one argsort for all columns, nan sorts last so the present values are ranked among themselves
+    #the work is done on the transpose so every column is contiguous for the sort
+    columns = np.ascontiguousarray(values.T)
+    rows = columns.shape[1]
+    if rows == 0:
+        return values.copy()
+    order = np.argsort(columns, axis=1)
+    ordered = np.take_along_axis(columns, order, axis=1)
+    positions = np.arange(rows)
+    starts = np.ones(columns.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = np.ones(columns.shape, dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    #first and last position of the tie run every sorted value belongs to
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, positions, rows - 1)[:, ::-1], axis=1)[:, ::-1]
+    result = np.empty(columns.shape, dtype=np.float64)
+    np.put_along_axis(result, order, (first + last) / 2 + 1, axis=1)
+    result[np.isnan(columns)] = np.nan
+    return result.T
+
+def pairwise_pearson(values : np.ndarray) -> tuple:
+    #(correlations, pair counts) over the rows where both columns are present, what DataFrame.corr() computes
+    #the columns are centred on their own mean first so large magnitudes (Volume) lose no precision in the sums
+    present = ~np.isnan(values)
+    mask = present.astype(np.float64)
+    means = np.nansum(values, axis=0) / np.maximum(present.sum(axis=0), 1)
+    centred = np.where(present, values - means, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pairs = mask.T @ mask
+        sums = centred.T @ mask
+        squares = (centred ** 2).T @ mask
+        products = centred.T @ centred
+        #sums[i, j] is the sum of column i over the rows where j is present too
+        covariance = products - sums * sums.T / pairs
+        variance = squares - sums ** 2 / pairs
+        correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[pairs < 2] = np.nan
+    return np.clip(correlation, -1, 1), pairs.astype(np.int64)
+
+def pairwise_spearman(values : np.ndarray) -> tuple:
+    #(correlations, pair counts) ranked over the rows where both columns are present, what DataFrame.corr("spearman") computes
+    #columns missing the same rows share one ranking of the whole block, only pairs whose missing rows differ are ranked again
+    correlation, pairs = pairwise_pearson(ranks(values))
+    present = ~np.isnan(values)
+    for i in range(values.shape[1]):
+        for j in range(i + 1, values.shape[1]):
+            if pairs[i, j] < 2 or np.array_equal(present[:, i], present[:, j]):
+                continue
+            rows = present[:, i] & present[:, j]
+            pair, _ = pairwise_pearson(ranks(np.column_stack((values[rows, i], values[rows, j]))))
+            correlation[i, j] = correlation[j, i] = pair[0, 1]
+    return correlation, pairs
+
+def _matrices(values : np.ndarray, names : list, methods : list) -> dict:
+    result = {}
+    for method in methods:
+        correlation, pairs = pairwise_spearman(values) if method == "spearman" else pairwise_pearson(values)
+        result[method] = pd.DataFrame(correlation, index=names, columns=names)
+    result["pairs"] = pd.DataFrame(pairs, index=names, columns=names)
+    return result
+
+def correlations(df : pd.DataFrame, by : str = "Region", methods : list = METHODS, pooled : bool = True) -> dict:
+    #{group: {"pearson": matrix, "spearman": matrix, "pairs": rows behind every entry}} for every group of by
+    #and for the whole registry under "All" when pooled is set, by=None only computes the pooled matrices
+    encoded = encode(df, by)
+    names = list(encoded.columns)
+    values = encoded.to_numpy(dtype=np.float64)
+    result = {}
+    if by is not None:
+        codes, groups = pd.factorize(df[by], sort=True)
+        #one sort by group makes every group a contiguous slice
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(groups) + 1), side="left")
+        grouped = values[order]
+        for position, group in enumerate(groups):
+            result[group] = _matrices(grouped[bounds[position]:bounds[position + 1]], names, methods)
+    if pooled or by is None:
+        result["All"] = _matrices(values, names, methods)
+    return result
+
+def correlation_table(result : dict, methods : list = METHODS) -> pd.DataFrame:
+    #long table of every matrix, one row per group, method and variable, for writing to csv
+    frames = []
+    for group, matrices in result.items():
+        for method in methods + ["pairs"]:
+            frame = matrices[method].rename_axis("variable").reset_index()
+            frame.insert(0, "method", method)
+            frame.insert(0, "group", group)
+            frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def stratified_sample(codes : np.ndarray, size : int = SAMPLE_SIZE, seed : int = 0) -> np.ndarray:
+    #sorted row indices of about size rows, every group keeps its share of the rows (at least one row when it has any)
+    #codes are group codes as from pd.factorize, -1 rows are never drawn
+    codes = np.asarray(codes)
+    rng = np.random.default_rng(seed)
+    groups, counts = np.unique(codes[codes >= 0], return_counts=True)
+    total = counts.sum()
+    if total <= size:
+        return np.flatnonzero(codes >= 0)
+    chosen = []
+    for group, count in zip(groups, counts):
+        rows = np.flatnonzero(codes == group)
+        chosen.append(rng.choice(rows, size=max(1, round(size * count / total)), replace=False))
+    return np.sort(np.concatenate(chosen))
+
+def heatmap(file : str, matrix : pd.DataFrame, title : str) -> str:
+    #saved without pyplot, so nothing opens a window or blocks
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(14, 12))
+    axes = figure.subplots()
+    image = axes.imshow(matrix.to_numpy(), cmap="coolwarm", vmin=-1, vmax=1)
+    axes.set_xticks(range(len(matrix.columns)), matrix.columns, rotation=90, fontsize=8)
+    axes.set_yticks(range(len(matrix.index)), matrix.index, fontsize=8)
+    axes.set_title(title)
+    figure.colorbar(image, ax=axes)
+    figure.tight_layout()
+    figure.savefig(file)
+    return file
+
+def scatter(file : str, x : np.ndarray, y : np.ndarray, groups : np.ndarray, labels : list, xlabel : str, ylabel : str, title : str) -> str:
+    #one colour per group, x, y and groups are usually a stratified_sample of the registry
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=(10, 6))
+    axes = figure.subplots()
+    for code, label in enumerate(labels):
+        rows = groups == code
+        axes.scatter(x[rows], y[rows], alpha=0.5, s=10, label=label)
+    axes.set_xlabel(xlabel, fontsize=12)
+    axes.set_ylabel(ylabel, fontsize=12)
+    axes.set_title(title, fontsize=14)
+    axes.grid(True)
+    axes.legend()
+    figure.savefig(file)
+    return file
@@ -1,25 +1,44 @@
+import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
+import dam_dataset
+import loss_statistics
+import correlation
 
-# Load the CSV file
-data = pd.read_csv('dam_data.csv')
+# Heatmaps and the scatter plot are optional, the correlation tables do not need them
+make_plots = True
 
-# Identify the columns that contain "failure" (case-insensitive)
-failure_columns = [col for col in data.columns if 'failure' in col.lower()]
+# Load the CSV file
+data = dam_dataset.load_dam_data('dam_data.csv')
 
-# Create a new column "total_loss" as the sum of the failure columns
-data['total_loss'] = data[failure_columns].sum(axis=1)
+# Total loss is the sum of the three loss given failure columns (not the probability of failure)
+data = loss_statistics.add_loss_columns(data)
 
 # Use the properly capitalized column name for inspection frequency
 inspection_column = 'Inspection Frequency'
 if inspection_column not in data.columns:
     raise ValueError(f"Column '{inspection_column}' not found in data. Check the column name.")
 
-# Create the scatterplot of total_loss vs. Inspection Frequency
-plt.figure(figsize=(10, 6))
-plt.scatter(data['total_loss'], data[inspection_column], alpha=0.7, edgecolor='k')
-plt.xlabel('Total Loss (Sum of Failure Columns)', fontsize=12)
-plt.ylabel('Inspection Frequency', fontsize=12)
-plt.title('Scatterplot of Total Loss vs. Inspection Frequency', fontsize=14)
-plt.grid(True)
-plt.show()
+output_dir = os.path.join("graphs", "correlation")
+os.makedirs(output_dir, exist_ok=True)
+
+# Pearson and Spearman matrices for every region and the pooled registry
+result = correlation.correlations(data, by="Region")
+correlation.correlation_table(result).to_csv(os.path.join(output_dir, "correlation_matrices.csv"), index=False)
+
+for group, matrices in result.items():
+    print(f"\nSpearman correlation with Probability of Failure in {group}:")
+    print(matrices["spearman"]["Probability of Failure"].drop("Probability of Failure").sort_values(key=np.abs, ascending=False).head(8).round(3).to_string())
+
+if make_plots:
+    for group, matrices in result.items():
+        for method in correlation.METHODS:
+            correlation.heatmap(os.path.join(output_dir, f"{str(group).lower()}_{method}_heatmap.png"), matrices[method],
+                                f"{method.capitalize()} Correlation, {group}")
+
+    # Scatterplot of total loss vs. Inspection Frequency on a stratified sample, every region keeps its share of the points
+    codes, regions = pd.factorize(data["Region"], sort=True)
+    rows = correlation.stratified_sample(codes)
+    correlation.scatter(os.path.join(output_dir, "total_loss_vs_inspection_frequency.png"),
+                        data["Total Loss Given Failure"].to_numpy()[rows], data[inspection_column].to_numpy()[rows], codes[rows], list(regions),
+                        'Total Loss Given Failure (Million £)', 'Inspection Frequency', 'Scatterplot of Total Loss vs. Inspection Frequency')
@@ -0,0 +1,207 @@
+#typed loading of the dam_data csv files through a binary columnar cache
+#each csv is parsed once into one .npy file per column, later loads memory map the numeric columns instead of re-parsing
+#a csv's cache is a directory of versions plus a pointer file naming the current one, rebuilds write a new version and swap the pointer,
+#so readers in other processes always find a complete cache, and builders of the same csv take turns through a lock file
+import hashlib
+import json
+import os
+import shutil
+import time
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+import instrumentation
+
+CACHE_DIRECTORY = os.environ.get("SOA_DATA_CACHE", ".dam_cache")
+CACHE_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "current"
+LOCK_FILE = "lock"
+#times a load starts over when a rebuild removed the version it was reading
+LOAD_ATTEMPTS = 3
+
+#declared schema for every column that appears in dam_data.csv and the files derived from it
+#"category" columns are returned as pandas categoricals, "string" columns as strings
+#"numeric" columns are float64, "year" columns are float64 once imputed but still hold raw strings like 1968M or DD/MM/YYYY before that
+CATEGORICAL_COLUMNS = ["Region", "Regulated Dam", "Primary Purpose", "Primary Type", "Spillway", "Hazard", "Assessment"]
+SCHEMA = {
+    "ID" : "string",
+    "Region" : "category",
+    "Regulated Dam" : "category",
+    "Primary Purpose" : "category",
+    "Primary Type" : "category",
+    "Height (m)" : "numeric",
+    "Length (km)" : "numeric",
+    "Volume (m3)" : "numeric",
+    "Year Completed" : "numeric",
+    "Years Modified" : "year",
+    "Surface (km2)" : "numeric",
+    "Drainage (km2)" : "numeric",
+    "Spillway" : "category",
+    "Last Inspection Date" : "year",
+    "Inspection Frequency" : "numeric",
+    "Distance to Nearest City (km)" : "numeric",
+    "Hazard" : "category",
+    "Assessment" : "category",
+    "Assessment Date" : "year",
+    "Probability of Failure" : "numeric",
+    "Loss given failure - prop (Qm)" : "numeric",
+    "Loss given failure - liab (Qm)" : "numeric",
+    "Loss given failure - BI (Qm)" : "numeric",
+    "Total Loss Given Failure" : "numeric",
+    "Expected Loss Value" : "numeric",
+}
+_READ_DTYPES = {column : "float64" for column, kind in SCHEMA.items() if kind == "numeric"} | {column : "str" for column, kind in SCHEMA.items() if kind in ("string", "category")}
+
+def source_hash(path : str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _source_state(path : str, verify_hash : bool) -> dict:
+    stat = os.stat(path)
+    state = {"version" : CACHE_VERSION, "mtime_ns" : stat.st_mtime_ns, "size" : stat.st_size}
+    if verify_hash:
+        state["sha256"] = source_hash(path)
+    return state
+
+def cache_path(path : str, directory : str = CACHE_DIRECTORY) -> str:
+    absolute = os.path.abspath(path)
+    return os.path.join(directory, f"{os.path.basename(absolute)}.{hashlib.sha1(absolute.encode()).hexdigest()[:12]}")
+
+def _is_fresh(manifest_path : str, state : dict) -> bool:
+    if not os.path.exists(manifest_path):
+        return False
+    with open(manifest_path) as file:
+        manifest = json.load(file)
+    return all(manifest["source"].get(key) == value for key, value in state.items())
+
+def _current_version(target : str) -> str:
+    #directory of the cache version the pointer names, None when there is none yet
+    try:
+        with open(os.path.join(target, CURRENT_FILE)) as file:
+            return os.path.join(target, file.read().strip())
+    except FileNotFoundError:
+        return None
+
+def _is_current(target : str, state : dict) -> bool:
+    version = _current_version(target)
+    return version is not None and _is_fresh(os.path.join(version, MANIFEST_FILE), state)
+
+@contextmanager
+def _build_lock(target : str):
+    #exclusive lock on <target>/lock while a cache version is built, without fcntl (windows) the pointer swap alone keeps readers safe
+    with open(os.path.join(target, LOCK_FILE), "a") as file:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        yield
+
+def _write_version(df : pd.DataFrame, target : str, state : dict, path : str) -> str:
+    #writes every column of df into a new version directory, returns its name
+    version = f"v{time.time_ns()}.{os.getpid()}"
+    staging = os.path.join(target, f"{version}.tmp")
+    os.makedirs(staging)
+    columns = []
+    for position, column in enumerate(df.columns):
+        values = df[column]
+        file_name = f"{position}.npy"
+        if pd.api.types.is_numeric_dtype(values.dtype):
+            np.save(os.path.join(staging, file_name), values.to_numpy(dtype=np.float64))
+            columns.append({"name" : column, "file" : file_name, "kind" : "numeric"})
+        else:
+            codes, labels = pd.factorize(values, use_na_sentinel=True)
+            np.save(os.path.join(staging, file_name), codes.astype(np.int32))
+            kind = "category" if SCHEMA.get(column) == "category" else "string"
+            columns.append({"name" : column, "file" : file_name, "kind" : kind, "labels" : [str(label) for label in labels]})
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as file:
+        json.dump({"source" : state, "path" : os.path.abspath(path), "rows" : len(df), "columns" : columns}, file)
+    os.rename(staging, os.path.join(target, version))
+    return version
+
+def build_cache(path : str, directory : str = CACHE_DIRECTORY, verify_hash : bool = False) -> str:
+    #parses the csv once with the declared dtypes and writes one .npy per column, returns the directory of the new version
+    #text columns are stored as int32 codes (-1 for missing) plus their labels in the manifest
+    #a builder that waited on the lock while another built the same source uses that version instead of parsing again
+    target = cache_path(path, directory)
+    state = _source_state(path, verify_hash)
+    os.makedirs(target, exist_ok=True)
+    with _build_lock(target):
+        if _is_current(target, state):
+            return _current_version(target)
+        with instrumentation.span("csv.read", file=path):
+            df = pd.read_csv(path, dtype=_READ_DTYPES)
+        instrumentation.count("csv.rows_read", len(df))
+        version = _write_version(df, target, state, path)
+        #the pointer is replaced in one step, readers see the old version or the new one and never a missing cache
+        pointer = os.path.join(target, f"{CURRENT_FILE}.{version}.tmp")
+        with open(pointer, "w") as file:
+            file.write(version)
+        os.replace(pointer, os.path.join(target, CURRENT_FILE))
+        #older versions and leftovers of crashed builds go, arrays already mapped from them stay readable
+        for name in os.listdir(target):
+            if name in (version, CURRENT_FILE, LOCK_FILE):
+                continue
+            old = os.path.join(target, name)
+            if os.path.isdir(old):
+                shutil.rmtree(old, ignore_errors=True)
+            else:
+                os.remove(old)
+    return os.path.join(target, version)
+
+def _cached_manifest(path : str, directory : str, verify_hash : bool) -> tuple:
+    state = _source_state(path, verify_hash)
+    target = cache_path(path, directory)
+    version = _current_version(target)
+    if version is None or not _is_fresh(os.path.join(version, MANIFEST_FILE), state):
+        version = build_cache(path, directory, verify_hash)
+    with open(os.path.join(version, MANIFEST_FILE)) as file:
+        return version, json.load(file)
+
+def _decode(codes : np.ndarray, labels : list, categorical : bool):
+    if categorical:
+        return pd.Categorical.from_codes(codes, categories=labels)
+    decoded = np.asarray(labels + [np.nan], dtype=object)
+    #-1 indexes the trailing nan
+    return decoded[codes]
+
+def _load_version(version : str, manifest : dict, columns : list, categorical : bool) -> dict:
+    arrays = {}
+    for column in manifest["columns"]:
+        if columns is not None and column["name"] not in columns:
+            continue
+        values = np.load(os.path.join(version, column["file"]), mmap_mode="r")
+        if column["kind"] != "numeric":
+            values = _decode(np.asarray(values), column["labels"], categorical and column["kind"] == "category")
+        arrays[column["name"]] = values
+    return arrays
+
+def load_columns(path : str, columns : list = None, categorical : bool = True, directory : str = CACHE_DIRECTORY, verify_hash : bool = False) -> dict:
+    #returns {column: array}, numeric columns are read only memory maps into the cache and cost no parsing or copying
+    #categorical=False returns the categorical columns as plain strings, like pd.read_csv does
+    with instrumentation.span("cache.load", file=path):
+        for attempt in range(LOAD_ATTEMPTS):
+            try:
+                return _load_version(*_cached_manifest(path, directory, verify_hash), columns, categorical)
+            except FileNotFoundError:
+                #a concurrent rebuild removed the version between reading the pointer and mapping its files
+                if attempt == LOAD_ATTEMPTS - 1:
+                    raise
+
+def load_dam_data(path : str, columns : list = None, categorical : bool = True, directory : str = CACHE_DIRECTORY, verify_hash : bool = False) -> pd.DataFrame:
+    #drop in replacement for pd.read_csv on the dam_data files
+    #copy=False keeps every column in its own block instead of consolidating (and copying) them,
+    #so the numeric columns are views of the cache's read only memory maps until written to, copy on write then gives the frame its own copy
+    return pd.DataFrame(load_columns(path, columns, categorical, directory, verify_hash), copy=False)
+
+def invalidate(path : str = None, directory : str = CACHE_DIRECTORY):
+    #removes the cache of one csv, or the whole cache directory when path is None
+    targets = [cache_path(path, directory)] if path is not None else [os.path.join(directory, name) for name in os.listdir(directory)] if os.path.isdir(directory) else []
+    for target in targets:
+        if os.path.isdir(target):
+            shutil.rmtree(target, ignore_errors=True)
@@ -1,14 +1,8 @@
-import machine_learning
-import pandas as pd
-import ydf
+import parallel_regions
+import model_factory
 
-output = pd.DataFrame()
-ydf.verbose(0)
-for frequency in range (10):
-    flumevale_data = machine_learning.expected_losses_given_min_frequency("dam_data_imputed_flumevale.csv", frequency, 95, False , True)
-    lyndrassia_data = machine_learning.expected_losses_given_min_frequency("dam_data_imputed_lyndrassia.csv", frequency, 95, False, True)
-    navaldia_data = machine_learning.expected_losses_given_min_frequency("dam_data_imputed_navaldia.csv", frequency, 95, False, True)
-    curr_output = pd.DataFrame([flumevale_data | lyndrassia_data | navaldia_data]) #concat
-    output = pd.concat([output, curr_output], ignore_index=False)
-    print(f"Finished frequency = {frequency} ...")
-#output.to_excel("frequencyVSdecreaseloss.xlsx")
\ No newline at end of file
+if __name__ == "__main__":
+    #one training pass per region, every minimum frequency is predicted in the same batch and the regions run in parallel
+    output = parallel_regions.frequency_sweep_regions(["dam_data_imputed_flumevale.csv", "dam_data_imputed_lyndrassia.csv", "dam_data_imputed_navaldia.csv"], range(10), 95, False, profile=model_factory.FINAL_PROFILE)
+    print(output)
+    #output.to_excel("frequencyVSdecreaseloss.xlsx")
@@ -1,115 +1,186 @@
-import pandas as pd
-import numpy as np
+#only numpy is imported up front so a worker that just needs the moments starts quickly,
+#pandas, scipy and the csv cache are imported by the functions that use them
+#the band helpers (total_loss_percentile, gov_total_loss_90, ...) query a risk_bands index of the frame, built on first use and kept while the frame lives,
+#so asking for many bands of one frame sorts it once
+from __future__ import annotations
 import math
+import weakref
+from typing import TYPE_CHECKING
+import numpy as np
+import instrumentation
+if TYPE_CHECKING:
+    import pandas as pd
+
+#columns the moment computations are addressed by
+PROBABILITY_COLUMN = "Probability of Failure"
+LOSS_COLUMN = "Total Loss Given Failure"
+EXPECTED_COLUMN = "Expected Loss Value"
+#how the scenario functions get the moments behind threshold_statistics: the normal approximation,
+#loss_simulation's simulated years, or the normal approximation with bootstrap confidence intervals
+THRESHOLD_METHODS = ["normal", "simulation", "bootstrap"]
+#id(frame) -> (weak reference to the frame, its risk_bands index)
+_band_indexes = {}
 
 
 def z_value(standard_deviation : float, expected_value :float):
     return float(standard_deviation * 2.326 + expected_value)
 
-def gov_total_loss_90(file :str) -> (tuple): 
-    df = pd.read_csv(f"{file}")
-    df.sort_values("Expected Loss Value", axis= 0, ascending=False, inplace=True)
-    df_analyze = df.head(int(df.index.size / 10) + df.index.size % 10)
-    expected_value = df_analyze.get(["Expected Loss Value"]).sum()
-    total_loss_avg = df_analyze.get(["Total Loss Given Failure"]).sum()
-    df_analyze.to_csv(f"outlier_{file}")
-    cumulative_variance = 0
-    print(df_analyze.columns.get_loc("Total Loss Given Failure"))
-    for i in range(df_analyze.index.size):
-        second_moment = df_analyze.iloc[i, 18] * df_analyze.iloc[i, 22] * df_analyze.iloc[i, 22]
-        variance = second_moment - df_analyze.iloc[i, 23] * df_analyze.iloc[i, 23]
-        cumulative_variance = variance + cumulative_variance
-    standard_deviation = math.sqrt(cumulative_variance)
-
-    print(f"""Region: {df.iloc[3,1]}\nAverage Loss Given Failure: {total_loss_avg.values[0]}\nExpected Value: {expected_value.values[0]}\nStandard Deviation: {standard_deviation}\nVariance: {cumulative_variance}\nNumber of Dams: {df_analyze.index.size}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
-    return total_loss_avg.values[0], expected_value.values[0], standard_deviation, cumulative_variance, df_analyze.index.size
-
-
-def gov_average_loss_90(file :str) -> (tuple): 
-    df = pd.read_csv(f"{file}")
-    df.sort_values("Expected Loss Value", axis= 0, ascending=False, inplace=True)
-    df_analyze = df.head(int(df.index.size / 10) + df.index.size % 10)
-    expected_value = df_analyze.get(["Expected Loss Value"]).sum()
-    total_loss_avg = df_analyze.get(["Total Loss Given Failure"]).sum() / df_analyze.index.size
-    df_analyze.to_csv(f"outlier_{file}")
-    cumulative_variance = 0
-    print(df_analyze.columns.get_loc("Total Loss Given Failure"))
-    for i in range(df_analyze.index.size):
-        second_moment = df_analyze.iloc[i, 18] * df_analyze.iloc[i, 22] * df_analyze.iloc[i, 22]
-        variance = second_moment - df_analyze.iloc[i, 23] * df_analyze.iloc[i, 23]
-        cumulative_variance = variance + cumulative_variance
-    expected_value = expected_value / df_analyze.index.size
-    cumulative_variance = cumulative_variance / df_analyze.index.size
-    standard_deviation = math.sqrt(cumulative_variance)
-
-    print(f"""Region: {df.iloc[3,1]}\nAverage Loss Given Failure: {total_loss_avg.values[0]}\nExpected Value: {expected_value.values[0]}\nStandard Deviation: {standard_deviation}\nVariance: {cumulative_variance}\nNumber of Dams: {df_analyze.index.size}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
-    return total_loss_avg.values[0], expected_value.values[0], standard_deviation, cumulative_variance, df_analyze.index.size
-
-
-def total_loss_percentile(file : str, lower_percentile : int, upper_percentile : int, verbose : bool) -> (tuple):
-    df = pd.read_csv(f"{file}")
-    df.sort_values("Expected Loss Value", axis= 0, ascending=True, inplace=True)
-    lower_bound = int(df.index.size * lower_percentile / 100)
-    upper_bound = int(df.index.size * upper_percentile / 100)
-    df_analyze = df.iloc[lower_bound:upper_bound]
-    expected_value = df_analyze.get(["Expected Loss Value"]).sum()
-    total_loss_avg = df_analyze.get(["Total Loss Given Failure"]).sum()
-    df_analyze.to_csv(f"outlier_{file}")
-    cumulative_variance = 0
-    if verbose:
-        print(df_analyze.columns.get_loc("Total Loss Given Failure"))
-    for i in range(df_analyze.index.size):
-        second_moment = df_analyze.iloc[i, 18] * df_analyze.iloc[i, 22] * df_analyze.iloc[i, 22]
-        variance = second_moment - df_analyze.iloc[i, 23] * df_analyze.iloc[i, 23]
-        cumulative_variance = variance + cumulative_variance
-    standard_deviation = math.sqrt(cumulative_variance)
-    if verbose:
-        print(f"""Region: {df.iloc[3,1]}\nAverage Loss Given Failure: {total_loss_avg.values[0]}\nExpected Value: {expected_value.values[0]}\nStandard Deviation: {standard_deviation}\nVariance: {cumulative_variance}\nNumber of Dams: {df_analyze.index.size}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
-    return total_loss_avg.values[0], expected_value.values[0], standard_deviation, cumulative_variance, df_analyze.index.size
-
-def average_loss_percentile(file : str, lower_percentile : int, upper_percentile : int, verbose : False) -> (tuple):
-    df = pd.read_csv(f"{file}")
-    df.sort_values("Expected Loss Value", axis= 0, ascending=True, inplace=True)
-    lower_bound = int(df.index.size * lower_percentile / 100)
-    upper_bound = int(df.index.size * upper_percentile / 100)
-    df_analyze = df.iloc[lower_bound:upper_bound]
-    #print(df_analyze.to_string())
-    expected_value = df_analyze.get(["Expected Loss Value"]).sum()
-    total_loss_avg = df_analyze.get(["Total Loss Given Failure"]).sum() / df_analyze.index.size
-    df_analyze.to_csv(f"outlier_{file}")
-    cumulative_variance = 0
-    if verbose:
-        print(df_analyze.columns.get_loc("Total Loss Given Failure"))
-    for i in range(df_analyze.index.size):
-        second_moment = df_analyze.iloc[i, 18] * df_analyze.iloc[i, 22] * df_analyze.iloc[i, 22]
-        variance = second_moment - df_analyze.iloc[i, 23] * df_analyze.iloc[i, 23]
-        cumulative_variance = variance + cumulative_variance
-    expected_value = expected_value / df_analyze.index.size
-    cumulative_variance = cumulative_variance / df_analyze.index.size
-    standard_deviation = math.sqrt(cumulative_variance)
-    if verbose:
-        print(f"""Region: {df.iloc[3,1]}\nAverage Loss Given Failure: {total_loss_avg.values[0]}\nExpected Value: {expected_value.values[0]}\nStandard Deviation: {standard_deviation}\nVariance: {cumulative_variance}\nNumber of Dams: {df_analyze.index.size}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
-    return total_loss_avg.values[0], expected_value.values[0], standard_deviation, cumulative_variance, df_analyze.index.size
-
-def yearly_loss_percentile(file : str, lower_percentile : int, upper_percentile : int, verbose : bool) -> (tuple):
-    df = pd.read_csv(f"{file}")
-    df.sort_values("Expected Loss Value", axis= 0, ascending=True, inplace=True)
-    lower_bound = int(df.index.size * lower_percentile / 100)
-    upper_bound = int(df.index.size * upper_percentile / 100)
-    df_analyze = df.iloc[lower_bound:upper_bound]
-    expected_value = df_analyze.get(["Expected Loss Value"]).sum()
-    total_loss_avg = df_analyze.get(["Total Loss Given Failure"]).sum()
-    df_analyze.to_csv(f"outlier_{file}")
-    cumulative_variance = 0
+def band_bounds(size : int, lower_percentile : float, upper_percentile : float) -> tuple:
+    #same truncation as slicing df.iloc[lower_bound:upper_bound] after sorting
+    return int(size * lower_percentile / 100), int(size * upper_percentile / 100)
+
+def portfolio_moments(probability : np.ndarray, total_loss : np.ndarray, expected_loss : np.ndarray = None, lower_percentile : float = 0, upper_percentile : float = 100, top : int = None) -> dict:
+    #each dam is a Bernoulli(p) failure paying its total loss given failure
+    #the band is either the [lower_percentile, upper_percentile) slice of the dams sorted by expected loss (ascending)
+    #or, when top is given, the top dams with the largest expected loss
+    probability = np.asarray(probability, dtype=np.float64)
+    total_loss = np.asarray(total_loss, dtype=np.float64)
+    if expected_loss is None:
+        expected_loss = probability * total_loss
+    else:
+        expected_loss = np.asarray(expected_loss, dtype=np.float64)
+
+    with instrumentation.span("moments.portfolio", rows=int(probability.size)):
+        if top is None:
+            order = np.argsort(expected_loss, kind="stable")
+            lower_bound, upper_bound = band_bounds(order.size, lower_percentile, upper_percentile)
+            rows = order[lower_bound:upper_bound]
+        else:
+            order = np.argsort(-expected_loss, kind="stable")
+            rows = order[:top]
+
+        band_probability = probability[rows]
+        band_loss = total_loss[rows]
+        band_expected = expected_loss[rows]
+        #var(X) = E[X^2] - E[X]^2 with E[X^2] = p * L^2
+        variance = float(np.sum(band_probability * band_loss * band_loss - band_expected * band_expected))
+        expected_value = float(np.sum(band_expected))
+    count = int(rows.size)
+    return {
+        "rows" : rows,
+        "count" : count,
+        "total_loss" : float(np.sum(band_loss)),
+        "expected_value" : expected_value,
+        "mean" : expected_value / count if count else math.nan,
+        "variance" : variance,
+        "standard_deviation" : math.sqrt(variance),
+    }
+
+def band_index(df : pd.DataFrame) -> dict:
+    #the risk_bands index of df, rebuilt when any of its probability or loss values changed since the last call
+    import risk_bands
+    columns = [df[column].to_numpy() for column in (PROBABILITY_COLUMN, LOSS_COLUMN, EXPECTED_COLUMN)]
+    cached = _band_indexes.get(id(df))
+    if cached is not None and cached[0]() is df:
+        index = cached[1]
+        if all(np.array_equal(values, known, equal_nan=True) for values, known in zip(columns, (index["probability"], index["total_loss"], index["terms"]["expected_value"]))):
+            return index
+    with instrumentation.span("moments.band_index", rows=int(len(df))):
+        index = risk_bands.build_index(*columns)
+    key = id(df)
+    _band_indexes[key] = (weakref.ref(df, lambda _, key=key: _band_indexes.pop(key, None)), index)
+    return index
+
+def frame_moments(df : pd.DataFrame, lower_percentile : float = 0, upper_percentile : float = 100, top : int = None) -> dict:
+    #portfolio_moments of the frame's band, answered from its band_index
+    import risk_bands
+    index = band_index(df)
+    return risk_bands.band(index, lower_percentile, upper_percentile) if top is None else risk_bands.top(index, top)
+
+def yearly_tuple(moments : dict) -> tuple:
+    #probabilities of failure are over a ten year horizon
+    variance = moments["variance"] / 10
+    return moments["total_loss"], moments["expected_value"] / 10, math.sqrt(variance), variance, moments["count"]
+
+def yearly_moments(df : pd.DataFrame, lower_percentile : float = 0, upper_percentile : float = 100) -> tuple:
+    #same tuple as yearly_loss_percentile, computed in memory without any file io
+    moments = frame_moments(df, lower_percentile, upper_percentile)
+    return yearly_tuple(moments)
+
+def government_layer(data : tuple, initial_percentile : float) -> tuple:
+    #(gov_threshold, gov_reserve) for a yearly_loss_percentile tuple, the government pays annual losses from the threshold up to threshold + reserve
+    #ndtri is what scipy.stats.norm.ppf evaluates, without importing all of scipy.stats
+    from scipy.special import ndtri
+    gov_threshold = ndtri(initial_percentile/100) * data[2] + data[1] #one standard deviation, covers 95% to 99.7% of all cases
+    gov_reserve = ndtri(0.997) * data[2] + data[1] - gov_threshold
+    return gov_threshold, gov_reserve
+
+def check_method(method : str):
+    if method not in THRESHOLD_METHODS:
+        raise ValueError(f"method must be one of {THRESHOLD_METHODS}, got {method!r}")
+
+def threshold_statistics(old_data : tuple, new_data : tuple, initial_percentile : float, region : str, verbose : bool) -> dict:
+    #old_data and new_data are yearly_loss_percentile tuples before and after a policy change
+    #ndtr is what scipy.stats.norm.cdf evaluates
+    from scipy.special import ndtr, ndtri
+    gov_threshold, gov_reserve = government_layer(old_data, initial_percentile)
+    new__gov_detachment_point = ndtri(0.997) * new_data[2] + new_data[1] #the amount of money for 99.7% of all cases
+    new_gov_threshold = new__gov_detachment_point - gov_reserve
+    new_percentile = ndtr((new_gov_threshold - new_data[1]) / new_data[2])
     if verbose:
-        print(df_analyze.columns.get_loc("Total Loss Given Failure"))
-    for i in range(df_analyze.index.size):
-        second_moment = df_analyze.iloc[i, 18] * df_analyze.iloc[i, 22] * df_analyze.iloc[i, 22]
-        variance = second_moment - df_analyze.iloc[i, 23] * df_analyze.iloc[i, 23]
-        cumulative_variance = variance + cumulative_variance
-    expected_value = expected_value / 10
-    cumulative_variance = cumulative_variance / 10
-    standard_deviation = math.sqrt(cumulative_variance)
+        print("Based on the original data, the threshold should be:", gov_threshold, "and the reserve is", gov_reserve)
+        print(f"The expected value of the new data is {new_data[1]} with standard deviation {new_data[2]}.")
+        print(f"This means the government detachment point is {new__gov_detachment_point} and the detachment point is {new_gov_threshold}.")
+        print(f"The insurance companies will expect to pay {new_data[1]} instead of {old_data[1]}. This represents a decreased payout of {new_data[1] - old_data[1]}")
+        print(f"The government threshold will also shift by {new_gov_threshold - gov_threshold}")
+        print(f"This is the {new_percentile * 100} percentile.")
+
+    ans = {f"Threshold percent {region}" : new_percentile}
+    ans.update({f"Original Threshold {region}": gov_threshold})
+    ans.update({f"New Threshold {region}" : new_gov_threshold})
+    ans.update({f"Change in Threshold {region}" : new_gov_threshold - gov_threshold})
+    ans.update({f"Original Expected Payout {region}" : old_data[1]})
+    ans.update({f"New Expected Payout {region}" : new_data[1]})
+    ans.update({f"Change in Payout {region}" : new_data[1] - old_data[1]})
+    return ans
+
+def load_frame(data) -> pd.DataFrame:
+    #every entry point accepts either a csv path or a DataFrame that is already in memory
+    import pandas as pd
+    if isinstance(data, pd.DataFrame):
+        return data
+    import dam_dataset
+    return dam_dataset.load_dam_data(f"{data}")
+
+def _top_decile_size(size : int) -> int:
+    return int(size / 10) + size % 10
+
+def _summarise(df : pd.DataFrame, moments : dict, outlier_file : str, total_loss : float, expected_value : float, variance : float, verbose : bool) -> tuple:
+    #the analysed band is only written out when an outlier_file is asked for
+    if outlier_file is not None:
+        with instrumentation.span("csv.write", file=outlier_file):
+            df.iloc[moments["rows"]].to_csv(outlier_file)
+    standard_deviation = math.sqrt(variance)
     if verbose:
-        print(f"""Region: {df.iloc[3,1]}\nAverage Loss Given Failure: {total_loss_avg.values[0]}\nExpected Value: {expected_value.values[0]}\nStandard Deviation: {standard_deviation}\nVariance: {cumulative_variance}\nNumber of Dams: {df_analyze.index.size}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
-    return total_loss_avg.values[0], expected_value.values[0], standard_deviation, cumulative_variance, df_analyze.index.size
\ No newline at end of file
+        print(f"""Region: {df["Region"].iloc[3]}\nAverage Loss Given Failure: {total_loss}\nExpected Value: {expected_value}\nStandard Deviation: {standard_deviation}\nVariance: {variance}\nNumber of Dams: {moments["count"]}\nExpected Reserves: {z_value(standard_deviation, expected_value)}\n\n""")
+    return total_loss, expected_value, standard_deviation, variance, moments["count"]
+
+def gov_total_loss_90(file, outlier_file : str = None) -> (tuple):
+    df = load_frame(file)
+    moments = frame_moments(df, top=_top_decile_size(df.index.size))
+    return _summarise(df, moments, outlier_file, moments["total_loss"], moments["expected_value"], moments["variance"], True)
+
+
+def gov_average_loss_90(file, outlier_file : str = None) -> (tuple):
+    df = load_frame(file)
+    moments = frame_moments(df, top=_top_decile_size(df.index.size))
+    count = moments["count"]
+    return _summarise(df, moments, outlier_file, moments["total_loss"] / count, moments["expected_value"] / count, moments["variance"] / count, True)
+
+
+def total_loss_percentile(file, lower_percentile : int, upper_percentile : int, verbose : bool, outlier_file : str = None) -> (tuple):
+    df = load_frame(file)
+    moments = frame_moments(df, lower_percentile, upper_percentile)
+    return _summarise(df, moments, outlier_file, moments["total_loss"], moments["expected_value"], moments["variance"], verbose)
+
+def average_loss_percentile(file, lower_percentile : int, upper_percentile : int, verbose : False, outlier_file : str = None) -> (tuple):
+    df = load_frame(file)
+    moments = frame_moments(df, lower_percentile, upper_percentile)
+    count = moments["count"]
+    return _summarise(df, moments, outlier_file, moments["total_loss"] / count, moments["expected_value"] / count, moments["variance"] / count, verbose)
+
+def yearly_loss_percentile(file, lower_percentile : int, upper_percentile : int, verbose : bool, outlier_file : str = None) -> (tuple):
+    df = load_frame(file)
+    moments = frame_moments(df, lower_percentile, upper_percentile)
+    total_loss, expected_value, standard_deviation, variance, count = yearly_tuple(moments)
+    return _summarise(df, moments, outlier_file, total_loss, expected_value, variance, verbose)
@@ -0,0 +1,185 @@
+#importable version of the testing_one.py imputation
+#dates are parsed with vectorized string operations, by default the KNN neighbour search covers the whole registry like testing_one.py always did,
+#which is what the committed dam_data_imputed_*.csv files hold
+#the neighbours are found with KD-trees over the dams sharing a missingness pattern instead of KNNImputer's all pairs distance matrix, see _impute_partition,
+#which picks the same neighbours and runs about three times faster on the registry
+#partition_columns=['Region'] searches every region separately, and in parallel, so the cost grows with the largest region instead of the registry,
+#but a dam's neighbours then all come from its own region and the imputed values differ from the committed files
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.metrics.pairwise import nan_euclidean_distances
+from sklearn.neighbors import KDTree
+import instrumentation
+
+categorical_cols = ['Region', 'Regulated Dam', 'Primary Purpose', 'Primary Type',
+                    'Spillway', 'Hazard', 'Assessment']
+numeric_cols = [
+    'Height (m)', 'Length (km)', 'Volume (m3)', 'Year Completed', 'Surface (km2)',
+    'Drainage (km2)', 'Inspection Frequency', 'Distance to Nearest City (km)',
+    'Probability of Failure', 'Loss given failure - prop (Qm)',
+    'Loss given failure - liab (Qm)', 'Loss given failure - BI (Qm)',
+    'Last Inspection Date', 'Assessment Date', 'Years Modified'
+]
+date_cols = ['Last Inspection Date', 'Assessment Date', 'Years Modified']
+rounded_cols = ['Year Completed', 'Years Modified', 'Inspection Frequency']
+#rows sharing one missingness pattern get their own KD-tree once there are this many of them, smaller patterns are searched by brute force
+TREE_MIN_ROWS = 64
+
+def extract_years(values : pd.Series) -> pd.Series:
+    #"DD/MM/YYYY" -> YYYY, "1968M" -> 1968 and "2008" -> 2008, anything else is missing
+    text = values.astype("string").str.strip()
+    parts = text.str.extract(r'^(?:.*/(\d+)|(\d+)[A-Za-z]?)$')
+    return pd.to_numeric(parts[0].fillna(parts[1]), errors="coerce").astype(float)
+
+def encode_categoricals(df : pd.DataFrame) -> tuple:
+    #integer codes per column with missing values encoded as their own 'Missing' label, like LabelEncoder on the filled column
+    encoded = {}
+    classes = {}
+    for col in categorical_cols:
+        codes, labels = pd.factorize(df[col].astype(object).fillna('Missing'), sort=True)
+        encoded[col] = codes.astype(float)
+        classes[col] = np.asarray(labels, dtype=object)
+    return pd.DataFrame(encoded, index=df.index), classes
+
+def _impute_partition(data_scaled : np.ndarray, n_neighbors : int) -> np.ndarray:
+    #the same uniform KNN imputation as KNNImputer(keep_empty_features=True) without its receivers * rows distance matrix
+    #KNNImputer's nan euclidean distance is the euclidean distance over the features both rows have, scaled by features / features in common,
+    #so between two fixed missingness patterns it is a plain euclidean distance and every large pattern gets a KD-tree per set of shared features,
+    #the rows of small patterns are pooled and measured directly
+    #every column a receiver misses then takes the mean of its n_neighbors nearest candidates that have the column
+    missing = np.isnan(data_scaled)
+    imputed = data_scaled.copy()
+    if not missing.any():
+        return imputed
+    n_features = data_scaled.shape[1]
+    patterns, pattern_of, sizes = np.unique(missing, axis=0, return_inverse=True, return_counts=True)
+    members = np.split(np.argsort(pattern_of, kind="stable"), np.cumsum(sizes)[:-1])
+    large = [pattern for pattern in range(len(patterns)) if sizes[pattern] >= TREE_MIN_ROWS]
+    pooled = np.flatnonzero(sizes[pattern_of] < TREE_MIN_ROWS)
+    everything = np.arange(len(data_scaled))
+    #a column nobody has is imputed with 0 like keep_empty_features, a receiver without any comparable donor gets the column mean like KNNImputer
+    empty = missing.all(axis=0)
+    column_means = np.where(empty, 0, np.nanmean(np.where(empty, 0, data_scaled), axis=0))
+    trees = {}
+    for pattern in np.flatnonzero(patterns.any(axis=1)):
+        receivers = members[pattern]
+        rows = data_scaled[receivers]
+        #the best n_neighbors of every large pattern that has some of the missing columns, as {pattern: (squared distances, donor rows)}
+        #a few receivers are cheaper to measure against every row than to query every tree
+        searched, compared = (large, pooled) if sizes[pattern] >= TREE_MIN_ROWS else ([], everything)
+        candidates = {}
+        for donor_pattern in searched:
+            shared = ~patterns[pattern] & ~patterns[donor_pattern]
+            if not (patterns[pattern] & ~patterns[donor_pattern]).any() or not shared.any():
+                continue
+            key = (donor_pattern, shared.tobytes())
+            if key not in trees:
+                trees[key] = KDTree(data_scaled[members[donor_pattern]][:, shared])
+            distances, nearest = trees[key].query(rows[:, shared], k=min(n_neighbors, sizes[donor_pattern]))
+            candidates[donor_pattern] = (distances ** 2 * n_features / shared.sum(), members[donor_pattern][nearest])
+        #compared rows without any feature in common are nan and never count, they sort last as inf
+        if len(compared):
+            compared_distances = nan_euclidean_distances(rows, data_scaled[compared], squared=True)
+            compared_distances[np.isnan(compared_distances)] = np.inf
+        for column in np.flatnonzero(patterns[pattern]):
+            blocks = [block for donor_pattern, block in candidates.items() if not patterns[donor_pattern][column]]
+            having = compared[~missing[compared, column]]
+            if len(having):
+                #only the compared rows' own best n_neighbors can make the final cut
+                having_distances = compared_distances[:, ~missing[compared, column]]
+                count = min(n_neighbors, len(having))
+                nearest = np.argpartition(having_distances, count - 1, axis=1)[:, :count]
+                blocks.append((np.take_along_axis(having_distances, nearest, axis=1), having[nearest]))
+            distances = np.concatenate([block[0] for block in blocks], axis=1) if blocks else np.empty((len(receivers), 0))
+            donors = np.concatenate([block[1] for block in blocks], axis=1) if blocks else np.empty((len(receivers), 0), dtype=np.intp)
+            count = min(n_neighbors, distances.shape[1])
+            if count == 0:
+                imputed[receivers, column] = column_means[column]
+                continue
+            nearest = np.argpartition(distances, count - 1, axis=1)[:, :count]
+            valid = np.isfinite(np.take_along_axis(distances, nearest, axis=1))
+            values = np.where(valid, data_scaled[np.take_along_axis(donors, nearest, axis=1), column], 0)
+            found = valid.sum(axis=1)
+            imputed[receivers, column] = np.where(found > 0, values.sum(axis=1) / np.maximum(found, 1), column_means[column])
+    return imputed
+
+def impute_dam_data(df : pd.DataFrame, partition_columns : list = None, n_neighbors : int = 5, processes : int = None) -> pd.DataFrame:
+    #returns the imputed registry with 'Last Inspection Date' dropped and 'Total Loss Given Failure' and 'Expected Loss Value' added
+    df = df.copy()
+    for col in categorical_cols:
+        df[col] = df[col].astype(object)
+    for col in date_cols:
+        df[col] = extract_years(df[col])
+
+    encoded, classes = encode_categoricals(df)
+    data_to_impute = pd.concat([df[numeric_cols].astype(float), encoded], axis=1)
+    cols_to_impute = numeric_cols + categorical_cols
+
+    #scale with the whole registry's statistics so every partition shares one distance metric
+    values = data_to_impute.to_numpy(dtype=float)
+    mean = np.nanmean(values, axis=0)
+    scale = np.nanstd(values, axis=0)
+    scale[~np.isfinite(scale) | (scale == 0)] = 1
+    mean[~np.isfinite(mean)] = 0
+    data_scaled = (values - mean) / scale
+
+    #partition_columns=None searches the whole registry at once, exactly like the original testing_one.py
+    if partition_columns is None:
+        groups = [np.arange(len(df))]
+    else:
+        groups = [np.asarray(rows) for rows in df.groupby(partition_columns, sort=True, dropna=False).indices.values()]
+    imputed_scaled = np.empty_like(data_scaled)
+    instrumentation.count("imputation.partitions", len(groups))
+    if processes is None:
+        processes = min(len(groups), os.cpu_count() or 1)
+    if processes <= 1:
+        results = [_impute_partition(data_scaled[rows], n_neighbors) for rows in groups]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_impute_partition, [data_scaled[rows] for rows in groups], [n_neighbors] * len(groups)))
+    for rows, result in zip(groups, results):
+        imputed_scaled[rows] = result
+
+    # Transform back to original scale
+    data_imputed = pd.DataFrame(imputed_scaled * scale + mean, columns=cols_to_impute, index=df.index)
+
+    # --- Decode Categorical Columns ---
+    for col in categorical_cols:
+        imputed_int = np.clip(np.rint(data_imputed[col].to_numpy()).astype(int), 0, len(classes[col]) - 1)
+        data_imputed[col] = classes[col][imputed_int]
+
+    # --- Round Specific Numeric Columns ---
+    for col in rounded_cols:
+        data_imputed[col] = data_imputed[col].round().astype(int)
+
+    # --- Preserve Original Non-Missing Values ---
+    df_final = df.copy()
+    for col in cols_to_impute:
+        df_final[col] = df_final[col].where(df_final[col].notna(), data_imputed[col])
+
+    df_final = df_final.drop(columns=['Last Inspection Date'])
+    df_final['Total Loss Given Failure'] = (
+        df_final['Loss given failure - prop (Qm)'] +
+        df_final['Loss given failure - liab (Qm)'] +
+        df_final['Loss given failure - BI (Qm)']
+    )
+    df_final['Expected Loss Value'] = (
+        df_final['Probability of Failure'] * df_final['Total Loss Given Failure']
+    )
+    df_final['Inspection Frequency'] = df_final['Inspection Frequency'].clip(lower=0)
+    return df_final
+
+def write_imputed(df_final : pd.DataFrame, output_file : str = "dam_data_imputed_new_columns.csv", region_files : bool = True) -> list:
+    #writes the full imputed registry and, when region_files is set, one dam_data_imputed_<region>.csv per region
+    written = [output_file]
+    with instrumentation.span("csv.write", file=output_file):
+        df_final.to_csv(output_file, index=False)
+    if region_files:
+        for region, region_df in df_final.groupby('Region', sort=True):
+            region_file = f"dam_data_imputed_{str(region).lower()}.csv"
+            with instrumentation.span("csv.write", file=region_file):
+                region_df.to_csv(region_file, index=False)
+            written.append(region_file)
+    return written
@@ -0,0 +1,71 @@
+#incremental scoring of policy scenarios
+#the model's per-dam predictions for the unchanged region are computed once, a scenario then only predicts the dams it actually changes,
+#splices them into the cached baseline and updates the portfolio moments from the changed dams' deltas
+import math
+import numpy as np
+import pandas as pd
+import instrumentation
+
+def baseline_scores(df : pd.DataFrame, model, dropped_columns : list, num_threads : int = None) -> dict:
+    #per-dam model predictions and moment terms for the unchanged data
+    features = df.drop(columns=dropped_columns)
+    with instrumentation.span("ydf.predict", rows=len(features)):
+        probability = np.asarray(model.predict(features, num_threads=num_threads), dtype=np.float64)
+    instrumentation.count("ydf.rows_predicted", len(features))
+    total_loss = df["Total Loss Given Failure"].to_numpy(dtype=np.float64)
+    expected = probability * total_loss
+    #var(X) = p * L^2 - (p * L)^2 per dam, summed the same way as gov_expenditure.portfolio_moments
+    variance_terms = probability * total_loss * total_loss - expected * expected
+    return {
+        "model" : model,
+        "num_threads" : num_threads,
+        "features" : features,
+        "probability" : probability,
+        "total_loss" : total_loss,
+        "expected" : expected,
+        "variance_terms" : variance_terms,
+        "total_loss_sum" : float(total_loss.sum()),
+        "expected_value" : float(expected.sum()),
+        "variance" : float(variance_terms.sum()),
+    }
+
+def score_variants(baseline : dict, variants : list) -> list:
+    #variants is a list of (rows, features) where features holds the changed feature rows for those positions
+    #every variant is predicted in one batched call and the new probabilities of the changed rows are returned per variant
+    sizes = [len(rows) for rows, _ in variants]
+    if sum(sizes) == 0:
+        return [np.empty(0) for _ in variants]
+    stacked = pd.concat([features for _, features in variants], ignore_index=True)
+    with instrumentation.span("ydf.predict", rows=len(stacked), variants=len(variants)):
+        predictions = np.asarray(baseline["model"].predict(stacked, num_threads=baseline["num_threads"]), dtype=np.float64)
+    instrumentation.count("ydf.rows_predicted", len(stacked))
+    return np.split(predictions, np.cumsum(sizes)[:-1])
+
+def splice(baseline : dict, rows : np.ndarray, new_probability : np.ndarray) -> np.ndarray:
+    #full probability vector with only the changed rows replaced
+    probability = baseline["probability"].copy()
+    probability[rows] = new_probability
+    return probability
+
+def baseline_moments(baseline : dict) -> dict:
+    #portfolio moments of the baseline predictions themselves, so a variant that changes nothing compares equal to them
+    return variant_moments(baseline, np.empty(0, dtype=np.intp), np.empty(0))
+
+def variant_moments(baseline : dict, rows : np.ndarray, new_probability : np.ndarray) -> dict:
+    #whole portfolio moments of a variant, updated from the changed rows instead of recomputed over every dam
+    instrumentation.count("moments.rows_updated", len(rows))
+    total_loss = baseline["total_loss"][rows]
+    new_expected = new_probability * total_loss
+    new_variance_terms = new_probability * total_loss * total_loss - new_expected * new_expected
+    expected_value = baseline["expected_value"] + float(np.sum(new_expected - baseline["expected"][rows]))
+    variance = baseline["variance"] + float(np.sum(new_variance_terms - baseline["variance_terms"][rows]))
+    count = baseline["probability"].size
+    return {
+        "count" : count,
+        "changed" : int(len(rows)),
+        "total_loss" : baseline["total_loss_sum"],
+        "expected_value" : expected_value,
+        "mean" : expected_value / count if count else math.nan,
+        "variance" : variance,
+        "standard_deviation" : math.sqrt(max(variance, 0.0)),
+    }
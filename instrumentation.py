@@ -0,0 +1,107 @@
+#timing spans and counters around csv io, ydf training and prediction, moment computation and plotting
+#switched on with SOA_TRACE=<file> (written when the process exits) or instrumentation.enable(<file>), off by default
+#when off, span() hands back one shared no-op context and count() returns straight away
+#the output is a chrome trace (open in chrome://tracing or https://ui.perfetto.dev) with a per span summary next to the events
+#usage: with instrumentation.span("ydf.predict", rows=len(features)): ...
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+TRACE_FILE = os.environ.get("SOA_TRACE") or None
+ENABLED = TRACE_FILE is not None
+
+_events = []
+_counters = {}
+_lock = threading.Lock()
+_DISABLED_SPAN = nullcontext()
+
+def enable(trace_file : str = None):
+    #trace_file=None collects events without writing them, for workers whose events are merged by the parent
+    global ENABLED, TRACE_FILE
+    ENABLED = True
+    TRACE_FILE = trace_file
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+def _now() -> float:
+    #chrome traces are in microseconds, perf_counter is system wide on linux so worker events line up with the parent's
+    return time.perf_counter_ns() / 1000
+
+@contextmanager
+def _span(name : str, args : dict):
+    start = _now()
+    try:
+        yield
+    finally:
+        event = {"name" : name, "cat" : name.split(".")[0], "ph" : "X", "ts" : start, "dur" : _now() - start, "pid" : os.getpid(), "tid" : threading.get_ident(), "args" : args}
+        with _lock:
+            _events.append(event)
+
+def span(name : str, **args):
+    #times the with block, args (row counts, file names, ...) are stored on the event
+    if not ENABLED:
+        return _DISABLED_SPAN
+    return _span(name, args)
+
+def count(name : str, value : float = 1):
+    #adds value to a running counter, every update is kept so the trace shows it over time
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        _events.append({"name" : name, "ph" : "C", "ts" : _now(), "pid" : os.getpid(), "tid" : threading.get_ident(), "args" : {name : _counters[name]}})
+
+def collect() -> list:
+    #takes every event recorded so far in this process
+    with _lock:
+        events = _events[:]
+        _events.clear()
+    return events
+
+def reset():
+    #drops every event and counter, forked workers start from the parent's buffers and must not send them back
+    with _lock:
+        _events.clear()
+        _counters.clear()
+
+def merge(events : list):
+    #adds events collected in another process
+    with _lock:
+        _events.extend(events)
+
+def summary(events : list) -> dict:
+    #span name -> calls and total seconds, counter name -> final value
+    spans = {}
+    counters = {}
+    for event in events:
+        if event["ph"] == "X":
+            entry = spans.setdefault(event["name"], {"calls" : 0, "seconds" : 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += event["dur"] / 1e6
+        elif event["ph"] == "C":
+            counters[(event["pid"], event["name"])] = event["args"][event["name"]]
+    totals = {}
+    for (_, name), value in counters.items():
+        totals[name] = totals.get(name, 0) + value
+    return {"spans" : dict(sorted(spans.items(), key=lambda item: -item[1]["seconds"])), "counters" : totals}
+
+def export(trace_file : str = None) -> str:
+    #writes the events recorded so far, returns the file name
+    trace_file = trace_file or TRACE_FILE
+    if trace_file is None:
+        raise ValueError("no trace file, pass one or set SOA_TRACE")
+    with _lock:
+        events = _events[:]
+    with open(trace_file, "w") as file:
+        json.dump({"traceEvents" : events, "displayTimeUnit" : "ms", "summary" : summary(events)}, file)
+    return trace_file
+
+@atexit.register
+def _export_at_exit():
+    if ENABLED and TRACE_FILE is not None and _events:
+        export(TRACE_FILE)
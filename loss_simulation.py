@@ -0,0 +1,142 @@
+#monte carlo simulation of a region's annual loss, used in place of the normal approximation in gov_expenditure.threshold_statistics
+#every simulated year each dam fails independently with its annual probability and the year's loss is the sum of the failed dams' total loss
+#years are simulated in fixed size seeded chunks and only the upper tail of the annual totals is kept, so memory does not grow with the year count
+import math
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+#probabilities of failure are over a ten year horizon, same as gov_expenditure.yearly_tuple
+ANNUAL_SCALE = 10
+#uniform draws per chunk, bounds the chunk's memory to about 4 bytes per draw
+MAX_DRAWS_PER_CHUNK = 1 << 23
+#simulated years used when the threshold calculation is switched to method="simulation"
+SIMULATION_YEARS = 200_000
+
+def _chunk_years(dams : int, chunk_years : int) -> int:
+    if chunk_years is not None:
+        return chunk_years
+    return max(1, MAX_DRAWS_PER_CHUNK // max(dams, 1))
+
+def _tail_size(years : int, tail_quantile : float) -> int:
+    #number of largest years needed for np.quantile style linear interpolation at any quantile >= tail_quantile
+    return years - math.floor((years - 1) * tail_quantile)
+
+def _chunk_losses(probability : np.ndarray, total_loss : np.ndarray, years : int, seed : np.random.SeedSequence) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    #draws are dams x years so each row compares against one dam's probability
+    failed = rng.random((probability.size, years), dtype=np.float32) < probability[:, None]
+    return total_loss @ failed
+
+def _simulate_chunk(probability : np.ndarray, total_loss : np.ndarray, years : int, seed : np.random.SeedSequence, keep : int) -> dict:
+    annual_loss = _chunk_losses(probability, total_loss, years, seed)
+    mean = float(annual_loss.mean())
+    tail = annual_loss if annual_loss.size <= keep else np.partition(annual_loss, annual_loss.size - keep)[-keep:]
+    return {"years" : years, "mean" : mean, "m2" : float(np.sum((annual_loss - mean) ** 2)), "max" : float(annual_loss.max()), "tail" : tail}
+
+def _merge(summary : dict, chunk : dict, keep : int) -> dict:
+    #chan et al. pairwise update of the running mean and sum of squared deviations
+    if summary is None:
+        return chunk
+    years = summary["years"] + chunk["years"]
+    delta = chunk["mean"] - summary["mean"]
+    tail = np.concatenate([summary["tail"], chunk["tail"]])
+    if tail.size > keep:
+        tail = np.partition(tail, tail.size - keep)[-keep:]
+    return {
+        "years" : years,
+        "mean" : summary["mean"] + delta * chunk["years"] / years,
+        "m2" : summary["m2"] + chunk["m2"] + delta * delta * summary["years"] * chunk["years"] / years,
+        "max" : max(summary["max"], chunk["max"]),
+        "tail" : tail,
+    }
+
+def _chunks(probability : np.ndarray, total_loss : np.ndarray, years : int, seed : int, chunk_years : int, annual_scale : float) -> tuple:
+    probability = np.asarray(probability, dtype=np.float32) / annual_scale
+    total_loss = np.asarray(total_loss, dtype=np.float32)
+    step = _chunk_years(probability.size, chunk_years)
+    sizes = [min(step, years - start) for start in range(0, years, step)]
+    return probability, total_loss, sizes, np.random.SeedSequence(seed).spawn(len(sizes))
+
+def annual_losses(probability : np.ndarray, total_loss : np.ndarray, years : int = SIMULATION_YEARS, seed : int = 0, chunk_years : int = None, annual_scale : float = ANNUAL_SCALE) -> np.ndarray:
+    #every simulated year's total loss, the same years simulate_annual_losses summarises for the same seed
+    probability, total_loss, sizes, seeds = _chunks(probability, total_loss, years, seed, chunk_years, annual_scale)
+    return np.concatenate([_chunk_losses(probability, total_loss, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]).astype(np.float64)
+
+def simulate_annual_losses(probability : np.ndarray, total_loss : np.ndarray, years : int = 1_000_000, seed : int = 0, tail_quantile : float = 0.9, chunk_years : int = None, processes : int = 1, annual_scale : float = ANNUAL_SCALE) -> dict:
+    #returns the simulated mean, variance and the sorted upper tail of the annual losses from tail_quantile upwards
+    #the chunks are seeded from seed in order, so the result does not depend on processes or chunk scheduling
+    probability, total_loss, sizes, seeds = _chunks(probability, total_loss, years, seed, chunk_years, annual_scale)
+    keep = _tail_size(years, tail_quantile)
+
+    summary = None
+    if processes <= 1:
+        for size, chunk_seed in zip(sizes, seeds):
+            summary = _merge(summary, _simulate_chunk(probability, total_loss, size, chunk_seed, keep), keep)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            for chunk in executor.map(_simulate_chunk, [probability] * len(sizes), [total_loss] * len(sizes), sizes, seeds, [keep] * len(sizes)):
+                summary = _merge(summary, chunk, keep)
+
+    variance = summary["m2"] / (years - 1) if years > 1 else 0.0
+    return {
+        "years" : years,
+        "mean" : summary["mean"],
+        "variance" : variance,
+        "standard_deviation" : math.sqrt(variance),
+        "max" : summary["max"],
+        "tail_quantile" : tail_quantile,
+        "tail" : np.sort(summary["tail"]).astype(np.float64),
+    }
+
+def frame_simulation(df, years : int = SIMULATION_YEARS, seed : int = 0) -> dict:
+    #simulation of a dam_data frame, the retained tail covers the upper half so simulated_cdf is defined around the threshold
+    return simulate_annual_losses(df["Probability of Failure"].to_numpy(), df["Total Loss Given Failure"].to_numpy(), years, seed, 0.5)
+
+def simulated_quantile(simulation : dict, quantile : float) -> float:
+    #same linear interpolation as np.quantile over every simulated year
+    if quantile < simulation["tail_quantile"]:
+        raise ValueError(f"quantile {quantile} is below the retained tail, simulate with tail_quantile <= {quantile}")
+    years = simulation["years"]
+    tail = simulation["tail"]
+    position = (years - 1) * quantile
+    lower = math.floor(position)
+    #tail[0] is the annual loss ranked years - tail.size
+    index = lower - (years - tail.size)
+    upper = min(index + 1, tail.size - 1)
+    return float(tail[index] + (position - lower) * (tail[upper] - tail[index]))
+
+def simulated_cdf(simulation : dict, value : float) -> float:
+    #fraction of simulated years with a loss at or below value, nan when value is below the retained tail
+    tail = simulation["tail"]
+    if value < tail[0]:
+        return math.nan
+    return 1 - (tail.size - np.searchsorted(tail, value, side="right")) / simulation["years"]
+
+def tail_value_at_risk(simulation : dict, quantile : float) -> float:
+    #expected annual loss in the years beyond the quantile
+    threshold = simulated_quantile(simulation, quantile)
+    tail = simulation["tail"]
+    return float(tail[tail >= threshold].mean())
+
+def simulated_threshold_statistics(old_simulation : dict, new_simulation : dict, initial_percentile : float, region : str, verbose : bool) -> dict:
+    #gov_expenditure.threshold_statistics with the normal ppf/cdf replaced by the simulated quantiles
+    gov_threshold = simulated_quantile(old_simulation, initial_percentile/100)
+    gov_reserve = simulated_quantile(old_simulation, 0.997) - gov_threshold
+    new__gov_detachment_point = simulated_quantile(new_simulation, 0.997) #the amount of money for 99.7% of all simulated years
+    new_gov_threshold = new__gov_detachment_point - gov_reserve
+    new_percentile = simulated_cdf(new_simulation, new_gov_threshold)
+    if verbose:
+        print("Based on the simulated original data, the threshold should be:", gov_threshold, "and the reserve is", gov_reserve)
+        print(f"The simulated expected value of the new data is {new_simulation['mean']} with standard deviation {new_simulation['standard_deviation']}.")
+        print(f"This means the government detachment point is {new__gov_detachment_point} and the detachment point is {new_gov_threshold}.")
+        print(f"The government threshold will also shift by {new_gov_threshold - gov_threshold}")
+        print(f"This is the {new_percentile * 100} percentile.")
+
+    ans = {f"Threshold percent {region}" : new_percentile}
+    ans.update({f"Original Threshold {region}": gov_threshold})
+    ans.update({f"New Threshold {region}" : new_gov_threshold})
+    ans.update({f"Change in Threshold {region}" : new_gov_threshold - gov_threshold})
+    ans.update({f"Original Expected Payout {region}" : old_simulation["mean"]})
+    ans.update({f"New Expected Payout {region}" : new_simulation["mean"]})
+    ans.update({f"Change in Payout {region}" : new_simulation["mean"] - old_simulation["mean"]})
+    return ans
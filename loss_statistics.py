@@ -0,0 +1,80 @@
+#quantiles, IQR whiskers and outlier counts of the loss columns for every group of a dam registry
+#the values are sorted once per column with the group as the leading key, after which every group is a sorted slice:
+#each quantile is an index lookup and the outlier counts are binary searches, nothing is scanned twice
+#quantiles use the same linear interpolation as pandas .quantile, missing values are left out like pandas does
+import numpy as np
+import pandas as pd
+
+LOSS_COLUMNS = ["Total Loss Given Failure", "Expected Loss Value"]
+DECILES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9]
+#whiskers sit this many IQRs beyond the quartiles
+WHISKER_IQR = 1.5
+
+def add_loss_columns(df : pd.DataFrame) -> pd.DataFrame:
+    #raw registry files carry only the three loss components and the probability of failure
+    #a missing loss component counts as no loss, same as four.py always did
+    if "Total Loss Given Failure" not in df.columns:
+        df = df.assign(**{"Total Loss Given Failure" : df["Loss given failure - prop (Qm)"].fillna(0) + df["Loss given failure - liab (Qm)"].fillna(0) + df["Loss given failure - BI (Qm)"].fillna(0)})
+    if "Expected Loss Value" not in df.columns:
+        df = df.assign(**{"Expected Loss Value" : df["Probability of Failure"] * df["Total Loss Given Failure"]})
+    return df
+
+def sorted_quantiles(values : np.ndarray, probabilities : np.ndarray) -> np.ndarray:
+    #quantiles of already sorted values, the interpolation matches np.quantile(method="linear") bit for bit
+    if values.size == 0:
+        return np.full(len(probabilities), np.nan)
+    position = (values.size - 1) * np.asarray(probabilities, dtype=np.float64)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, values.size - 1)
+    weight = position - lower
+    below = values[lower]
+    above = values[upper]
+    difference = above - below
+    return np.where(weight >= 0.5, above - difference * (1 - weight), below + difference * weight)
+
+def _group_summary(values : np.ndarray, probabilities : list) -> dict:
+    #values are sorted and free of missing values
+    q1, median, q3 = sorted_quantiles(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    lower_whisker = q1 - WHISKER_IQR * iqr
+    upper_whisker = q3 + WHISKER_IQR * iqr
+    row = {
+        "count" : values.size,
+        "mean" : values.mean() if values.size else np.nan,
+        "min" : values[0] if values.size else np.nan,
+        "q1" : q1,
+        "median" : median,
+        "q3" : q3,
+        "max" : values[-1] if values.size else np.nan,
+        "iqr" : iqr,
+        "lower_whisker" : lower_whisker,
+        "upper_whisker" : upper_whisker,
+        "outliers_below" : int(np.searchsorted(values, lower_whisker, side="left")),
+        "outliers_above" : int(values.size - np.searchsorted(values, upper_whisker, side="right")),
+    }
+    for probability, value in zip(probabilities, sorted_quantiles(values, probabilities)):
+        row[f"p{probability * 100:g}"] = value
+    return row
+
+def describe_losses(df : pd.DataFrame, columns : list = LOSS_COLUMNS, by : str = "Region", quantiles : list = DECILES) -> pd.DataFrame:
+    #one row per group and column, by=None describes the whole registry as a single group called "All"
+    #the p<percent> columns hold the requested quantiles next to the quartiles, whiskers and outlier counts
+    if by is None:
+        codes = np.zeros(len(df), dtype=np.intp)
+        groups = pd.Index(["All"])
+    else:
+        codes, groups = pd.factorize(df[by], sort=True)
+    rows = []
+    for column in columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        keep = ~np.isnan(values) & (codes >= 0)
+        group_codes = codes[keep]
+        values = values[keep]
+        #one sort for every group: by group code, then by value within the group
+        order = np.lexsort((values, group_codes))
+        values = values[order]
+        bounds = np.searchsorted(group_codes[order], np.arange(len(groups) + 1), side="left")
+        for position, group in enumerate(groups):
+            rows.append({"group" : group, "column" : column} | _group_summary(values[bounds[position]:bounds[position + 1]], quantiles))
+    table = pd.DataFrame(rows)
+    return table.rename(columns={"group" : by if by is not None else "group"})
@@ -1,80 +1,160 @@
 #libaries we used to create out program
+#ydf and matplotlib are imported on first use, see model_factory and plotting
+from __future__ import annotations
+from typing import TYPE_CHECKING
 import pandas as pd
 import numpy as np
-import ydf
-import matplotlib.pyplot as plot
 import gov_expenditure
-import scipy.stats
+import model_factory
+import loss_simulation
+import bootstrap
+import incremental_scoring
+import instrumentation
+import plotting
+import portfolio
+if TYPE_CHECKING:
+    import ydf
+
+#The columns were dropped for the following reasons:
+#ID: Independent from data
+#Years Modified: Insufficient data
+#Assessment date: insufficient data
+# loss given failure (all varieties): indepedent from dam failure probability rate
+# hazard: independent from dam failure probability rate
+DROPPED_COLUMNS = ["ID", "Years Modified", "Assessment Date", "Loss given failure - prop (Qm)", "Loss given failure - liab (Qm)", "Loss given failure - BI (Qm)", "Total Loss Given Failure", "Expected Loss Value", "Hazard"]
+
+def train_model(df : pd.DataFrame, profile : str = model_factory.FINAL_PROFILE) -> ydf.GenericModel:
+    #reuses the stored model when this data has been trained on with this profile before
+    return model_factory.train(df, DROPPED_COLUMNS, profile)
+
+def frequency_features(df : pd.DataFrame, frequencies : list) -> pd.DataFrame:
+    #stacks one copy of the feature frame per minimum frequency, block i has every frequency raised to at least frequencies[i]
+    features = df.drop(columns=DROPPED_COLUMNS)
+    stacked = pd.concat([features] * len(frequencies), ignore_index=True)
+    minimum = np.repeat(np.asarray(frequencies, dtype=np.float64), len(features))
+    stacked["Inspection Frequency"] = np.maximum(stacked["Inspection Frequency"].to_numpy(dtype=np.float64), minimum)
+    return stacked
+
+def frequency_variants(baseline : dict, frequencies : list) -> list:
+    #(rows, features) per minimum frequency holding only the dams inspected less often than it
+    current = baseline["features"]["Inspection Frequency"].to_numpy(dtype=np.float64)
+    variants = []
+    for frequency in frequencies:
+        rows = np.flatnonzero(current < frequency)
+        features = baseline["features"].iloc[rows].copy()
+        features["Inspection Frequency"] = float(frequency)
+        variants.append((rows, features))
+    return variants
+
+def multiplier_variants(baseline : dict, multipliers : list) -> list:
+    #(rows, features) per frequency multiplier holding only the dams whose inspection frequency actually changes
+    current = baseline["features"]["Inspection Frequency"].to_numpy(dtype=np.float64)
+    variants = []
+    for multiplier in multipliers:
+        rows = np.flatnonzero(current * multiplier != current)
+        features = baseline["features"].iloc[rows].copy()
+        features["Inspection Frequency"] = current[rows] * multiplier
+        variants.append((rows, features))
+    return variants
+
+def predict_min_frequencies(df : pd.DataFrame, model : ydf.GenericModel, frequencies : list, baseline : dict = None) -> np.ndarray:
+    #one model.predict over every minimum frequency, row i holds the probabilities of failure for frequencies[i]
+    #with a baseline from incremental_scoring.baseline_scores only the changed dams are predicted and spliced into it
+    if baseline is None:
+        features = frequency_features(df, frequencies)
+        with instrumentation.span("ydf.predict", rows=len(features), variants=len(frequencies)):
+            probabilities = np.asarray(model.predict(features, num_threads=model_factory.thread_count())).reshape(len(frequencies), len(df))
+        instrumentation.count("ydf.rows_predicted", len(features))
+        return probabilities
+    variants = frequency_variants(baseline, frequencies)
+    changed = incremental_scoring.score_variants(baseline, variants)
+    return np.stack([incremental_scoring.splice(baseline, rows, new_probability) for (rows, _), new_probability in zip(variants, changed)])
+
+def frequency_frame(df : pd.DataFrame, probabilities : np.ndarray) -> pd.DataFrame:
+    #the original data with the predictions for one minimum frequency swapped in, every other column is shared with df
+    new_df = df.copy(deep=False)
+    new_df["Probability of Failure"] = probabilities
+    new_df["Expected Loss Value"] = probabilities * new_df["Total Loss Given Failure"].to_numpy()
+    return new_df
+
+def draw_frequency_graph(df : pd.DataFrame, new_expected_loss : np.ndarray, frequency : int, bins : dict = None):
+    #queued on plotting's background pool, returns without waiting for the png
+    return plotting.frequency_histogram(df["Expected Loss Value"].to_numpy(), new_expected_loss, df["Region"].iloc[0], frequency, bins)
+
+#trains once and returns the government threshold and payout table for every minimum frequency, indexed by frequency
+#data is a csv path or a DataFrame, method="simulation" replaces the normal approximation with loss_simulation
+#and method="bootstrap" adds bootstrap confidence intervals next to every value
+#profile picks the model_factory training profile, the ydf defaults unless EXPLORATORY_PROFILE is passed for a quicker sweep
+def frequency_sweep(data, frequencies : list = range(10), initial_percentile : float = 95, make_graph : bool = False, verbose : bool = False, method : str = "normal", profile : str = model_factory.FINAL_PROFILE) -> pd.DataFrame:
+    gov_expenditure.check_method(method)
+    frequencies = list(frequencies)
+    df = gov_expenditure.load_frame(data)
+    model = train_model(df, profile)
+    df = portfolio.compact_frame(df)
+    #only the dams below each minimum frequency are re-scored, the rest keep the cached baseline prediction
+    baseline = incremental_scoring.baseline_scores(df, model, DROPPED_COLUMNS, model_factory.thread_count())
+    variants = frequency_variants(baseline, frequencies)
+    changed = incremental_scoring.score_variants(baseline, variants)
+    total_loss = df["Total Loss Given Failure"].to_numpy()
+    region = df["Region"].iloc[0]
+
+    old_data = gov_expenditure.yearly_moments(df)
+    #the new moments use the predicted Probability of Failure in the variance too, the committed frequencyVSdecreaseloss.xlsx kept the recorded one
+    #(its df.replace was a no-op), so the new thresholds are about 1200 lower than that file at minimum frequency 5, around 0.937 instead of 0.952
+    if method == "simulation":
+        #every frequency reuses the same seed so the threshold shifts are not swamped by simulation noise
+        old_simulation = loss_simulation.frame_simulation(df)
+    old_probability = df["Probability of Failure"].to_numpy()
+    if make_graph:
+        #every frequency's chart shares the same bin edges, binned from the yearly losses like the charts show them
+        bins = plotting.shared_bins(df["Expected Loss Value"].to_numpy() / 10, [incremental_scoring.splice(baseline, changed_rows, new_probability) * total_loss / 10 for (changed_rows, _), new_probability in zip(variants, changed)])
+    rows = []
+    for frequency, (changed_rows, _), new_probability in zip(frequencies, variants, changed):
+        if make_graph or method != "normal":
+            probability = incremental_scoring.splice(baseline, changed_rows, new_probability)
+        if make_graph:
+            draw_frequency_graph(df, probability * total_loss, frequency, bins)
+        if method == "simulation":
+            new_simulation = loss_simulation.simulate_annual_losses(probability, total_loss, loss_simulation.SIMULATION_YEARS, 0, 0.5)
+            rows.append(loss_simulation.simulated_threshold_statistics(old_simulation, new_simulation, initial_percentile, region, verbose))
+            continue
+        #the portfolio moments are updated from the changed dams only
+        new_data = gov_expenditure.yearly_tuple(incremental_scoring.variant_moments(baseline, changed_rows, new_probability))
+        statistics = gov_expenditure.threshold_statistics(old_data, new_data, initial_percentile, region, verbose)
+        if method == "bootstrap":
+            #every frequency resamples the same dams, so the intervals of different frequencies are comparable
+            statistics = bootstrap.with_intervals(statistics, bootstrap.replicate_statistics(old_probability, probability, total_loss, initial_percentile), region)
+        rows.append(statistics)
+    return pd.DataFrame(rows, index=pd.Index(frequencies, name="Minimum Frequency"))
 
 #this function returns the new government threshold based on their percentile of involvement and minimum frequency
-def expected_losses_given_min_frequency(file : str, frequency : int, initial_percentile: float, make_graph : bool, verbose : bool) -> tuple:
-    #decode the file
-    df = pd.read_csv(file)
-    train_df = df.copy(True)
-    #The columns were dropped for the following reasons:
-    #ID: Independent from data
-    #Years Modified: Insufficient data
-    #Assessment date: insufficient data
-    # loss given failure (all varieties): indepedent from dam failure probability rate
-    # hazard: independent from dam failure probability rate 
-    train_df = train_df.drop(columns=["ID", "Years Modified", "Assessment Date", "Assessment Date","Loss given failure - prop (Qm)","Loss given failure - liab (Qm)", "Loss given failure - BI (Qm)", "Total Loss Given Failure", "Expected Loss Value", "Hazard"])
-    test_df = train_df.copy(True)
-
-    # adjust all frequencies to be at least minimum frequency
-    for i in range(test_df.index.size):
-        if (test_df.loc[i, "Inspection Frequency"] < frequency):
-            test_df.loc[i, "Inspection Frequency"] = frequency
-    ydf.verbose(0)
-
-    #run machine model
-    model = ydf.GradientBoostedTreesLearner(label="Probability of Failure", task=ydf.Task.REGRESSION,).train(train_df)
-    ydf_prediction = model.predict(test_df)
-    
-    for i in range(test_df.index.size):
-        test_df.loc[i, "Probability of Failure"] = ydf_prediction[i]
-    
-    #input machine trained-information
-    new_df = df.copy(True) 
-    new_df = new_df.replace(new_df["Probability of Failure"], pd.Series(ydf_prediction))
-    for i in range(new_df.index.size):
-        new_df.loc[i, "Expected Loss Value"] = test_df.loc[i, "Probability of Failure"] * new_df.loc[i, "Total Loss Given Failure"] 
-    new_df.to_csv(f"machine_learning_frequency_adjusted_{df.loc[0, "Region"]}.csv", index = False)
+def expected_losses_given_min_frequency(file, frequency : int, initial_percentile: float, make_graph : bool, verbose : bool, export_file : str = None, profile : str = model_factory.FINAL_PROFILE, method : str = "normal") -> tuple:
+    gov_expenditure.check_method(method)
+    #decode the file, or use the DataFrame as is
+    df = gov_expenditure.load_frame(file)
+
+    #run machine model with all frequencies adjusted to be at least minimum frequency
+    model = train_model(df, profile)
+    new_df = frequency_frame(df, predict_min_frequencies(df, model, [frequency])[0])
+    #the adjusted frame stays in memory and is only written when export_file is given
+    if export_file is not None:
+        with instrumentation.span("csv.write", file=export_file):
+            new_df.to_csv(export_file, index = False)
 
     #make graph
     if make_graph:
-        compare_new = new_df["Expected Loss Value"].div(10).to_numpy()
-        compare_old = df["Expected Loss Value"].div(10).to_numpy()
-        plot.hist([compare_old, compare_new], bins=50,label=["Original", "After Frequency Change"])
-        plot.xlabel("Expected Loss Value, millions(£Q)")
-        plot.ylabel("Number of Dams")
-        plot.title(f"Reduction to losses by increased inspection frequency in {df.loc[0, "Region"]}")
-        plot.legend()
-        plot.savefig(f"frequency_adjusted_expected_loss_{frequency}_{df.loc[0, "Region"]}_histogram.png")
-        plot.clf()
+        draw_frequency_graph(df, new_df["Expected Loss Value"].to_numpy(), frequency)
+
+    #method="simulation" replaces the normal approximation with loss_simulation,
+    #method="bootstrap" adds confidence intervals for how much it depends on the particular dams, both compute their own moments
+    if method == "simulation":
+        return loss_simulation.simulated_threshold_statistics(loss_simulation.frame_simulation(df), loss_simulation.frame_simulation(new_df), initial_percentile, df["Region"].iloc[0], verbose)
+    if method == "bootstrap":
+        return bootstrap.frame_bootstrap(df, new_df, initial_percentile, df["Region"].iloc[0], verbose)
 
     #do computations to obtain our government threshold and reserve
-    new_data = gov_expenditure.yearly_loss_percentile(f"machine_learning_frequency_adjusted_{df.loc[0, "Region"]}.csv", 0, 100, verbose)
-    old_data = gov_expenditure.yearly_loss_percentile(file, 0, 100, verbose)
-    gov_threshold = scipy.stats.norm.ppf(initial_percentile/100) * old_data[2] + old_data[1] #one standard deviation, covers 95% to 99.7% of all cases
-    gov_reserve = scipy.stats.norm.ppf(0.997) * old_data[2] + old_data[1] - gov_threshold
-    new__gov_detachment_point = scipy.stats.norm.ppf(0.997) * new_data[2] + new_data[1] #the amount of money for 99.7% of all cases
-    new_gov_threshold = new__gov_detachment_point - gov_reserve
-    new_percentile = scipy.stats.norm.cdf(new_gov_threshold, new_data[1], new_data[2])
-    if verbose:
-        print("Based on the original data, the threshold should be:", gov_threshold, "and the reserve is", gov_reserve)
-        print(f"The expected value of the new data is {new_data[1]} with standard deviation {new_data[2]}.")
-        print(f"This means the government detachment point is {new__gov_detachment_point} and the detachment point is {new_gov_threshold}.")
-        print(f"The insurance companies will expect to pay {new_data[1]} instead of {old_data[1]}. This represents a decreased payout of {new_data[1] - old_data[1]}")
-        print(f"The government threshold will also shift by {new_gov_threshold - gov_threshold}")
-        print(f"This is the {new_percentile * 100} percentile.")
-    
+    new_data = gov_expenditure.yearly_loss_percentile(new_df, 0, 100, verbose)
+    old_data = gov_expenditure.yearly_loss_percentile(df, 0, 100, verbose)
 
     #return important information
-    ans = {f"Threshold percent {df.loc[0,"Region"]}" : new_percentile}
-    ans.update({f"Original Threshold {df.loc[0,"Region"]}": gov_threshold})
-    ans.update({f"New Threshold {df.loc[0,"Region"]}" : new_gov_threshold})
-    ans.update({f"Change in Threshold {df.loc[0,"Region"]}" : new_gov_threshold - gov_threshold})
-    ans.update({f"Original Expected Payout {df.loc[0,"Region"]}" : old_data[1]})
-    ans.update({f"New Expected Payout {df.loc[0,"Region"]}" : new_data[1]})
-    ans.update({f"Change in Payout {df.loc[0,"Region"]}" : new_data[1] - old_data[1]})
-    return ans
\ No newline at end of file
+    return gov_expenditure.threshold_statistics(old_data, new_data, initial_percentile, df["Region"].iloc[0], verbose)
@@ -0,0 +1,123 @@
+#named training profiles for the probability of failure model, shared by assessment_sensitivity, machine_learning and policy_solver
+#"default" is ydf's own defaults, which the committed results were produced with and which every function trains with unless told otherwise,
+#"fast" is for exploratory sweeps and solver probes that opt in, "accurate" and "balanced" trade training time for validation error
+#every profile pins its thread count instead of leaving ydf to take every core
+#usage: python model_factory.py [region files] compares the profiles' training time, prediction throughput and validation error
+from __future__ import annotations
+import os
+import sys
+import time
+from typing import TYPE_CHECKING
+import numpy as np
+import pandas as pd
+import model_store
+if TYPE_CHECKING:
+    import ydf
+
+LABEL = "Probability of Failure"
+#gradient boosted trees hyperparameters of every profile, anything not listed keeps the ydf default
+PROFILES = {
+    #ydf's defaults, the model every script trained before the profiles existed
+    "default" : {},
+    #few shallow trees with a high learning rate on half the rows and coarse feature bins, stops as soon as validation loss rises
+    "fast" : {
+        "num_trees" : 100,
+        "shrinkage" : 0.2,
+        "max_depth" : 5,
+        "subsample" : 0.5,
+        "discretize_numerical_columns" : True,
+        "num_discretized_numerical_bins" : 64,
+        "early_stopping" : "LOSS_INCREASE",
+        "early_stopping_num_trees_look_ahead" : 10,
+    },
+    #the ydf defaults with binned features, which trains faster for about the same error
+    "balanced" : {
+        "num_trees" : 300,
+        "shrinkage" : 0.1,
+        "max_depth" : 6,
+        "discretize_numerical_columns" : True,
+        "num_discretized_numerical_bins" : 255,
+        "early_stopping" : "LOSS_INCREASE",
+        "early_stopping_num_trees_look_ahead" : 30,
+    },
+    #many small steps on exact feature values, keeps the number of trees with the lowest validation loss
+    "accurate" : {
+        "num_trees" : 1000,
+        "shrinkage" : 0.05,
+        "max_depth" : 6,
+        "early_stopping" : "MIN_LOSS_FINAL",
+        "early_stopping_num_trees_look_ahead" : 50,
+    },
+}
+#profiles callers pick by name: sweeps may explore with the fast one, reported figures keep the model the committed outputs came from
+EXPLORATORY_PROFILE = "fast"
+FINAL_PROFILE = "default"
+#share of every region held out by the report to measure validation error
+VALIDATION_FRACTION = 0.2
+
+def hyperparameters(profile : str) -> dict:
+    if profile not in PROFILES:
+        raise ValueError(f"profile must be one of {list(PROFILES)}, got {profile!r}")
+    return dict(PROFILES[profile])
+
+def thread_count(num_threads : int = None) -> int:
+    #explicit thread count: the argument, else the process cap of model_store, else every core
+    return num_threads or model_store.NUM_THREADS or os.cpu_count() or 1
+
+def learner(profile : str, label : str = LABEL, num_threads : int = None) -> ydf.GradientBoostedTreesLearner:
+    import ydf
+    return ydf.GradientBoostedTreesLearner(label=label, task=ydf.Task.REGRESSION, num_threads=thread_count(num_threads), **hyperparameters(profile))
+
+def train(df : pd.DataFrame, dropped_columns : list, profile : str, label : str = LABEL, num_threads : int = None, directory : str = model_store.STORE_DIRECTORY) -> ydf.GenericModel:
+    #the profile's model on df, loaded from the model store when the same data was trained with the same profile before
+    import ydf
+    ydf.verbose(0)
+    return model_store.train_or_load(df, dropped_columns, label, hyperparameters(profile), directory, thread_count(num_threads))
+
+def _split(rows : int, validation_fraction : float, seed : int) -> tuple:
+    order = np.random.default_rng(seed).permutation(rows)
+    cut = rows - max(1, int(rows * validation_fraction))
+    return np.sort(order[:cut]), np.sort(order[cut:])
+
+def profile_report(files : list, dropped_columns : list, profiles : list = list(PROFILES), num_threads : int = None, validation_fraction : float = VALIDATION_FRACTION, seed : int = 0) -> pd.DataFrame:
+    #one row per region file and profile: training seconds, trees kept, prediction rows per second and validation error
+    #every profile is trained from scratch on the same split, the model store is not used so the timings are real
+    import ydf
+    import gov_expenditure
+    ydf.verbose(0)
+    threads = thread_count(num_threads)
+    rows = []
+    for file in files:
+        df = gov_expenditure.load_frame(file)
+        train_rows, validation_rows = _split(len(df), validation_fraction, seed)
+        features = df.drop(columns=dropped_columns)
+        training = features.iloc[train_rows]
+        validation = features.iloc[validation_rows]
+        actual = validation[LABEL].to_numpy(dtype=np.float64)
+        for profile in profiles:
+            start = time.perf_counter()
+            model = learner(profile, LABEL, threads).train(training)
+            train_seconds = time.perf_counter() - start
+            #prediction throughput is measured on the whole region, the size every scenario batch has
+            start = time.perf_counter()
+            model.predict(features, num_threads=threads)
+            predict_seconds = time.perf_counter() - start
+            error = np.asarray(model.predict(validation, num_threads=threads), dtype=np.float64) - actual
+            rows.append({
+                "Region" : df["Region"].iloc[0],
+                "profile" : profile,
+                "threads" : threads,
+                "train_seconds" : train_seconds,
+                "trees" : model.num_trees(),
+                "predict_rows_per_second" : len(features) / predict_seconds if predict_seconds > 0 else np.nan,
+                "validation_rmse" : float(np.sqrt(np.mean(error ** 2))),
+                "validation_mae" : float(np.mean(np.abs(error))),
+            })
+    return pd.DataFrame(rows)
+
+if __name__ == "__main__":
+    import assessment_sensitivity
+    import parallel_regions
+    report = profile_report(sys.argv[1:] or parallel_regions.REGION_FILES, assessment_sensitivity.DROPPED_COLUMNS)
+    print(report.to_string(index=False))
+    report.to_csv("model_profile_report.csv", index=False)
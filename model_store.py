@@ -0,0 +1,134 @@
+#on-disk store of trained ydf models so reruns on unchanged data skip training
+#each model lives in <directory>/<key>/ where key hashes the columns the model is trained on, label and hyperparameters,
+#so edits to the dropped columns (IDs, losses and so on) keep the stored models valid
+#ydf is imported on first use so importing the store (and the modules built on it) stays cheap
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import TYPE_CHECKING
+import pandas as pd
+import instrumentation
+if TYPE_CHECKING:
+    import ydf
+
+STORE_DIRECTORY = os.environ.get("SOA_MODEL_STORE", "model_store")
+#eviction limits, checked every time a new model is saved
+MAX_MODELS = 64
+MAX_BYTES = 2 * 1024 ** 3
+MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+METADATA_FILE = "store_metadata.json"
+#thread cap for ydf training and prediction in this process, None lets ydf use every core
+NUM_THREADS = None
+
+def set_num_threads(num_threads : int):
+    global NUM_THREADS
+    NUM_THREADS = num_threads
+
+def fingerprint(df : pd.DataFrame, dropped_columns : list, label : str, hyperparameters : dict) -> str:
+    import ydf
+    #only what ydf sees is hashed, the training frame's index is not a feature either
+    features = df.drop(columns=dropped_columns)
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(features, index=False).to_numpy().tobytes())
+    digest.update(json.dumps({
+        "columns" : [str(column) for column in features.columns],
+        "dtypes" : [str(dtype) for dtype in features.dtypes],
+        "label" : label,
+        "hyperparameters" : hyperparameters,
+        "ydf" : ydf.__version__,
+    }, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def _model_directory(key : str, directory : str) -> str:
+    return os.path.join(directory, key)
+
+def load_model(key : str, directory : str = STORE_DIRECTORY):
+    #returns None when the key is not in the store
+    path = _model_directory(key, directory)
+    metadata_path = os.path.join(path, METADATA_FILE)
+    if not os.path.exists(metadata_path):
+        return None
+    import ydf
+    model = ydf.load_model(path)
+    #the metadata file's mtime records the last use for eviction
+    os.utime(metadata_path)
+    return model
+
+def save_model(key : str, model : ydf.GenericModel, directory : str = STORE_DIRECTORY, metadata : dict = None):
+    os.makedirs(directory, exist_ok=True)
+    path = _model_directory(key, directory)
+    #save next to the final location and rename so concurrent readers never see a half written model
+    staging = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    model.save(staging)
+    with open(os.path.join(staging, METADATA_FILE), "w") as file:
+        json.dump({"key" : key, "created" : time.time()} | (metadata or {}), file, default=str)
+    try:
+        os.rename(staging, path)
+    except OSError:
+        #another process stored the same key first
+        shutil.rmtree(staging, ignore_errors=True)
+
+def _entries(directory : str) -> list:
+    entries = []
+    if not os.path.isdir(directory):
+        return entries
+    for key in os.listdir(directory):
+        path = os.path.join(directory, key)
+        metadata_path = os.path.join(path, METADATA_FILE)
+        if not os.path.exists(metadata_path):
+            continue
+        size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+        entries.append({"key" : key, "last_used" : os.path.getmtime(metadata_path), "bytes" : size})
+    return entries
+
+def invalidate(key : str = None, directory : str = STORE_DIRECTORY) -> int:
+    #removes one model, or every model when key is None, and returns the number removed
+    keys = [entry["key"] for entry in _entries(directory)] if key is None else [key]
+    removed = 0
+    for curr_key in keys:
+        path = _model_directory(curr_key, directory)
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+def evict(directory : str = STORE_DIRECTORY, max_models : int = MAX_MODELS, max_bytes : int = MAX_BYTES, max_age_seconds : float = MAX_AGE_SECONDS) -> list:
+    #drops models older than max_age_seconds, then least recently used models until both limits hold
+    entries = sorted(_entries(directory), key=lambda entry: entry["last_used"])
+    now = time.time()
+    evicted = []
+    total_bytes = sum(entry["bytes"] for entry in entries)
+    for entry in entries:
+        too_old = max_age_seconds is not None and now - entry["last_used"] > max_age_seconds
+        too_many = max_models is not None and len(entries) - len(evicted) > max_models
+        too_big = max_bytes is not None and total_bytes > max_bytes
+        if not (too_old or too_many or too_big):
+            continue
+        invalidate(entry["key"], directory)
+        evicted.append(entry["key"])
+        total_bytes -= entry["bytes"]
+    return evicted
+
+def train_or_load(df : pd.DataFrame, dropped_columns : list, label : str = "Probability of Failure", hyperparameters : dict = None, directory : str = STORE_DIRECTORY, num_threads : int = None) -> ydf.GenericModel:
+    #regression gradient boosted trees on df without dropped_columns, loaded from the store when the inputs are unchanged
+    #num_threads defaults to the process cap NUM_THREADS
+    hyperparameters = dict(hyperparameters or {})
+    key = fingerprint(df, dropped_columns, label, hyperparameters)
+    with instrumentation.span("model_store.load", key=key):
+        model = load_model(key, directory)
+    if model is not None:
+        instrumentation.count("model_store.hits")
+        return model
+    instrumentation.count("model_store.misses")
+    import ydf
+    #the thread count does not change the trained model so it is left out of the key
+    with instrumentation.span("ydf.train", rows=len(df)):
+        model = ydf.GradientBoostedTreesLearner(label=label, task=ydf.Task.REGRESSION, num_threads=num_threads or NUM_THREADS, **hyperparameters).train(df.drop(columns=dropped_columns))
+    with instrumentation.span("model_store.save", key=key):
+        save_model(key, model, directory, {"label" : label, "hyperparameters" : hyperparameters, "rows" : len(df)})
+    evict(directory)
+    return model
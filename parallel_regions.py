@@ -0,0 +1,101 @@
+#runs the region x scenario tasks of assessment_sensitivity and machine_learning on a process pool
+#regions share no state so each task runs in its own worker and the results are merged in submission order
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import pandas as pd
+import instrumentation
+import model_factory
+
+REGION_FILES = ["dam_data_imputed_flumevale.csv", "dam_data_imputed_lyndrassia.csv", "dam_data_imputed_navaldia.csv"]
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+def _set_thread_limits(threads_per_worker : int):
+    #cap every threaded library so workers * threads does not oversubscribe the cores
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(threads_per_worker)
+    import model_store
+    model_store.set_num_threads(threads_per_worker)
+
+@contextmanager
+def thread_limits(threads_per_worker : int):
+    #the worker limits for work run in this process, the caller's environment and ydf thread cap are put back afterwards
+    import model_store
+    previous = {variable : os.environ.get(variable) for variable in THREAD_VARIABLES}
+    previous_threads = model_store.NUM_THREADS
+    _set_thread_limits(threads_per_worker)
+    try:
+        yield
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+        model_store.set_num_threads(previous_threads)
+
+def _initialise_worker(threads_per_worker : int, traced : bool = False):
+    #pool workers keep their limits for their whole life
+    _set_thread_limits(threads_per_worker)
+    #workers only collect, their events travel back with each result and the parent writes the trace
+    #a forked worker holds a copy of the parent's events, they are dropped so only the worker's own come back
+    if traced:
+        instrumentation.reset()
+        instrumentation.enable(None)
+
+def _traced_task(function, task : tuple) -> tuple:
+    with instrumentation.span("parallel_regions.task", task=function.__name__):
+        result = function(*task)
+    return result, instrumentation.collect()
+
+def _assessment_task(file : str, replace_all : bool, export : bool, assessments : list, profile : str) -> pd.DataFrame:
+    import assessment_sensitivity
+    import plotting
+    if assessments is None:
+        assessments = assessment_sensitivity.ASSESSMENTS
+    result = assessment_sensitivity.find_assessment_sensitivity_region(file, replace_all, export, assessments, profile=profile)
+    #the charts are drawn in the background while the statistics are computed, the task ends once they are saved
+    plotting.shutdown()
+    return result
+
+def _frequency_task(file : str, frequencies : list, initial_percentile : float, make_graph : bool, profile : str) -> pd.DataFrame:
+    import machine_learning
+    import plotting
+    result = machine_learning.frequency_sweep(file, frequencies, initial_percentile, make_graph, False, profile=profile)
+    plotting.shutdown()
+    return result
+
+def _threads_per_worker(workers : int, threads_per_worker : int) -> int:
+    if threads_per_worker is not None:
+        return threads_per_worker
+    return max(1, (os.cpu_count() or 1) // workers)
+
+def run_tasks(function, tasks : list, workers : int = None, threads_per_worker : int = None) -> list:
+    #returns function(*task) for every task, in the order of tasks
+    workers = min(len(tasks), workers or os.cpu_count() or 1)
+    threads_per_worker = _threads_per_worker(workers, threads_per_worker)
+    if workers <= 1:
+        with thread_limits(threads_per_worker):
+            return [function(*task) for task in tasks]
+    traced = instrumentation.ENABLED
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initialise_worker, initargs=(threads_per_worker, traced)) as executor:
+        if not traced:
+            futures = [executor.submit(function, *task) for task in tasks]
+            return [future.result() for future in futures]
+        futures = [executor.submit(_traced_task, function, task) for task in tasks]
+        results = []
+        for future in futures:
+            result, events = future.result()
+            instrumentation.merge(events)
+            results.append(result)
+        return results
+
+def assessment_sensitivity_regions(files : list = REGION_FILES, replace_all_modes : list = [False], export : bool = False, assessments : list = None, workers : int = None, threads_per_worker : int = None, profile : str = model_factory.FINAL_PROFILE) -> pd.DataFrame:
+    #one task per region and replace_all mode, rows come back ordered by region then mode
+    tasks = [(file, replace_all, export, assessments, profile) for file in files for replace_all in replace_all_modes]
+    return pd.concat(run_tasks(_assessment_task, tasks, workers, threads_per_worker))
+
+def frequency_sweep_regions(files : list = REGION_FILES, frequencies : list = range(10), initial_percentile : float = 95, make_graph : bool = False, workers : int = None, threads_per_worker : int = None, profile : str = model_factory.FINAL_PROFILE) -> pd.DataFrame:
+    #one task per region, each region's threshold table is placed side by side in the order of files
+    tasks = [(file, list(frequencies), initial_percentile, make_graph, profile) for file in files]
+    return pd.concat(run_tasks(_frequency_task, tasks, workers, threads_per_worker), axis=1)
@@ -0,0 +1,272 @@
+#runs the whole workflow (impute, model scenarios, outlier bands, xlsx summaries) as declared stages and reruns only what is stale
+#every stage lists the files it reads and writes, its parameters, the function that builds it and the modules that function runs
+#a stage is fresh when the fingerprint of its input contents, parameters and module sources matches the last run and its outputs are untouched,
+#so editing dam_data.csv reimputes the registry, but only the regions whose imputed rows actually changed rerun their scenarios
+#stages whose inputs are ready run side by side on a process pool
+#usage: python pipeline.py [--dry-run] [--force stage ...] [--targets stage ...] [--workers n]
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext
+import pandas as pd
+import instrumentation
+import model_factory
+import parallel_regions
+
+STATE_FILE = ".pipeline_state.json"
+#where the stages' source files are, next to this file
+CODE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SOURCE_FILE = "dam_data.csv"
+IMPUTED_FILE = "dam_data_imputed_new_columns.csv"
+REGIONS = ["Flumevale", "Lyndrassia", "Navaldia"]
+#minimum inspection frequency of the exported machine_learning_frequency_adjusted_<Region>.csv files
+MIN_FREQUENCY = 5
+N_NEIGHBORS = 5
+
+#stage functions, each is called as function(inputs, outputs, **parameters) in a worker process
+
+def impute_stage(inputs : list, outputs : list, n_neighbors : int):
+    #the whole registry is imputed in one neighbour search like testing_one.py, so the region files match the committed ones
+    #outputs are the full imputed registry followed by its region files, which write_imputed names itself
+    import dam_dataset
+    import imputation
+    df = imputation.impute_dam_data(dam_dataset.load_dam_data(inputs[0], categorical=False), partition_columns=None, n_neighbors=n_neighbors)
+    imputation.write_imputed(df, outputs[0], region_files=True)
+
+def outlier_stage(inputs : list, outputs : list, lower_percentile : float, upper_percentile : float):
+    import gov_expenditure
+    gov_expenditure.yearly_loss_percentile(inputs[0], lower_percentile, upper_percentile, False, outputs[0])
+
+def frequency_adjusted_stage(inputs : list, outputs : list, frequency : int, initial_percentile : float, profile : str):
+    import machine_learning
+    machine_learning.expected_losses_given_min_frequency(inputs[0], frequency, initial_percentile, False, False, outputs[0], profile)
+
+def frequency_sweep_stage(inputs : list, outputs : list, frequencies : list, initial_percentile : float, profile : str):
+    import machine_learning
+    table = machine_learning.frequency_sweep(inputs[0], frequencies, initial_percentile, False, False, profile=profile)
+    table.to_csv(outputs[0])
+
+def assessment_stage(inputs : list, outputs : list, replace_all : bool, profile : str):
+    #outputs are the adjusted scenario csv, which find_assessment_sensitivity_region names itself, and the statistics table
+    import assessment_sensitivity
+    table = assessment_sensitivity.find_assessment_sensitivity_region(inputs[0], replace_all, False, export_csv=True, profile=profile)
+    table.to_csv(outputs[1])
+
+def excel_stage(inputs : list, outputs : list, axis : int):
+    #side by side (axis=1) or stacked (axis=0) tables of every region, as final_output.py and assessment_output.py write them
+    pd.concat([pd.read_csv(file, index_col=0) for file in inputs], axis=axis).to_excel(outputs[0])
+
+def stage(name : str, function, inputs : list, outputs : list, parameters : dict = None, code : list = ()) -> dict:
+    #code lists the source files whose edits make the stage stale
+    return {"name" : name, "function" : function, "inputs" : list(inputs), "outputs" : list(outputs), "parameters" : dict(parameters or {}), "code" : list(code)}
+
+def workflow(source : str = SOURCE_FILE, regions : list = REGIONS, frequency : int = MIN_FREQUENCY, frequencies : list = range(10), initial_percentile : float = 95, profile : str = model_factory.FINAL_PROFILE) -> list:
+    #the stages of testing_one.py, machine_learning, assessment_sensitivity, gov_expenditure, final_output.py and assessment_output.py
+    #the raw region files of two.py are not read by any stage, so they are left to two.py
+    #every module the stage functions import, directly or through each other, and this file, which holds the stage functions
+    moments_code = ["pipeline.py", "gov_expenditure.py", "dam_dataset.py", "instrumentation.py"]
+    scenario_code = moments_code + ["bootstrap.py", "incremental_scoring.py", "loss_simulation.py", "model_factory.py", "model_store.py", "plotting.py", "portfolio.py"]
+    imputed_files = {region : f"dam_data_imputed_{region.lower()}.csv" for region in regions}
+    stages = [stage("impute", impute_stage, [source], [IMPUTED_FILE] + list(imputed_files.values()), {"n_neighbors" : N_NEIGHBORS}, ["pipeline.py", "imputation.py", "dam_dataset.py", "instrumentation.py"])]
+    sweeps = []
+    assessments = {False : [], True : []}
+    for region in regions:
+        imputed = imputed_files[region]
+        frequency_file = f"machine_learning_frequency_adjusted_{region}.csv"
+        stages.append(stage(f"frequency_adjusted:{region}", frequency_adjusted_stage, [imputed], [frequency_file],
+                            {"frequency" : frequency, "initial_percentile" : initial_percentile, "profile" : profile}, ["machine_learning.py"] + scenario_code))
+        sweep_file = f"frequency_sweep_{region}.csv"
+        stages.append(stage(f"frequency_sweep:{region}", frequency_sweep_stage, [imputed], [sweep_file],
+                            {"frequencies" : list(frequencies), "initial_percentile" : initial_percentile, "profile" : profile}, ["machine_learning.py"] + scenario_code))
+        sweeps.append(sweep_file)
+        adjusted_files = [frequency_file]
+        for replace_all in (False, True):
+            adjusted = f"machine_learning_assessment_adjusted_{region}_Replaced_All_is_{replace_all}.csv"
+            table = f"assessment_sensitivity_{region}_Replaced_All_is_{replace_all}.csv"
+            stages.append(stage(f"assessment:{region}:{replace_all}", assessment_stage, [imputed], [adjusted, table],
+                                {"replace_all" : replace_all, "profile" : profile}, ["assessment_sensitivity.py"] + scenario_code))
+            assessments[replace_all].append(table)
+            adjusted_files.append(adjusted)
+        for file in [imputed] + adjusted_files:
+            stages.append(stage(f"outliers:{file}", outlier_stage, [file], [f"outlier_{file}"], {"lower_percentile" : 0, "upper_percentile" : 100}, moments_code))
+    stages.append(stage("excel:frequency", excel_stage, sweeps, ["frequencyVSdecreaseloss.xlsx"], {"axis" : 1}, ["pipeline.py"]))
+    stages.append(stage("excel:assessment_some", excel_stage, assessments[False], ["assessmentVSdecreaselossReplaceSOME.xlsx"], {"axis" : 0}, ["pipeline.py"]))
+    stages.append(stage("excel:assessment_all", excel_stage, assessments[True], ["assessmentVSdecreaselossReplaceALL.xlsx"], {"axis" : 0}, ["pipeline.py"]))
+    return stages
+
+def _load_state(state_file : str) -> dict:
+    if not os.path.exists(state_file):
+        return {"files" : {}, "stages" : {}}
+    with open(state_file) as file:
+        return json.load(file)
+
+def _save_state(state : dict, state_file : str):
+    staging = f"{state_file}.{os.getpid()}.tmp"
+    with open(staging, "w") as file:
+        json.dump(state, file, indent=1)
+    os.replace(staging, state_file)
+
+def file_hash(path : str, state : dict) -> str:
+    #content hash of path, None when it does not exist
+    #hashes are remembered by size and mtime in the state, so unchanged files are not read again
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    known = state["files"].get(path)
+    if known is not None and known["mtime_ns"] == stat.st_mtime_ns and known["size"] == stat.st_size:
+        return known["sha256"]
+    import dam_dataset
+    digest = dam_dataset.source_hash(path)
+    state["files"][path] = {"mtime_ns" : stat.st_mtime_ns, "size" : stat.st_size, "sha256" : digest}
+    return digest
+
+def fingerprint(entry : dict, state : dict) -> str:
+    #inputs and code by content, parameters by value
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        "name" : entry["name"],
+        "function" : f"{entry['function'].__module__}.{entry['function'].__qualname__}",
+        "code" : {path : file_hash(os.path.join(CODE_DIRECTORY, path), state) for path in entry["code"]},
+        "parameters" : entry["parameters"],
+        "inputs" : {path : file_hash(path, state) for path in entry["inputs"]},
+        "outputs" : entry["outputs"],
+    }, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def is_fresh(entry : dict, state : dict) -> bool:
+    recorded = state["stages"].get(entry["name"])
+    if recorded is None or recorded["fingerprint"] != fingerprint(entry, state):
+        return False
+    #outputs deleted or edited since the last run make the stage stale too
+    return all(file_hash(path, state) == recorded["outputs"].get(path) for path in entry["outputs"])
+
+def dependencies(stages : list) -> dict:
+    #{stage name: names of the stages that write its inputs}
+    producers = {path : entry["name"] for entry in stages for path in entry["outputs"]}
+    return {entry["name"] : sorted({producers[path] for path in entry["inputs"] if path in producers}) for entry in stages}
+
+def _selected(stages : list, targets : list, upstream : dict) -> list:
+    #targets and everything they are built from, in declaration order
+    if targets is None:
+        return stages
+    names = {entry["name"] for entry in stages}
+    unknown = [target for target in targets if target not in names]
+    if unknown:
+        raise ValueError(f"unknown stages {unknown}")
+    keep = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in keep:
+            keep.add(name)
+            pending.extend(upstream[name])
+    return [entry for entry in stages if entry["name"] in keep]
+
+def _run_stage(entry : dict):
+    with instrumentation.span("pipeline.stage", stage=entry["name"]):
+        entry["function"](entry["inputs"], entry["outputs"], **entry["parameters"])
+
+def plan(stages : list, state_file : str = STATE_FILE, force : list = (), targets : list = None) -> dict:
+    #{stage name: "stale" or "fresh"} without running anything, stages downstream of a stale one count as stale
+    state = _load_state(state_file)
+    upstream = dependencies(stages)
+    result = {}
+    for entry in _selected(stages, targets, upstream):
+        stale = entry["name"] in force or any(result[name] == "stale" for name in upstream[entry["name"]]) or not is_fresh(entry, state)
+        result[entry["name"]] = "stale" if stale else "fresh"
+    return result
+
+def run(stages : list, state_file : str = STATE_FILE, workers : int = None, threads_per_worker : int = None, force : list = (), targets : list = None, verbose : bool = True) -> dict:
+    #runs every stale stage once all the stages it reads from are done and returns {stage name: "ran", "fresh", "failed" or "skipped"}
+    #freshness is decided when a stage becomes ready, so a rerun upstream stage that rewrote identical files leaves its consumers alone
+    #a failed stage skips everything downstream of it, the other stages still run
+    state = _load_state(state_file)
+    upstream = dependencies(stages)
+    selected = _selected(stages, targets, upstream)
+    selected_names = {entry["name"] for entry in selected}
+    status = {}
+    waiting = list(selected)
+    running = {}
+    workers = max(1, min(len(selected), workers or os.cpu_count() or 1))
+    threads_per_worker = parallel_regions._threads_per_worker(workers, threads_per_worker)
+    traced = instrumentation.ENABLED
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=parallel_regions._initialise_worker, initargs=(threads_per_worker, traced))
+    #stages run in this process get the worker thread limits only while the pipeline runs
+    limits = nullcontext() if executor is not None else parallel_regions.thread_limits(threads_per_worker)
+
+    def finish(entry : dict, error : BaseException):
+        if error is not None:
+            status[entry["name"]] = "failed"
+            if verbose:
+                print(f"failed  {entry['name']}: {error!r}")
+            return
+        status[entry["name"]] = "ran"
+        #the fingerprint is taken after the run, from the inputs the stage actually read
+        state["stages"][entry["name"]] = {"fingerprint" : fingerprint(entry, state), "outputs" : {path : file_hash(path, state) for path in entry["outputs"]}}
+        _save_state(state, state_file)
+        if verbose:
+            print(f"ran     {entry['name']}")
+
+    try:
+        with limits:
+            while waiting or running:
+                for entry in list(waiting):
+                    needed = [status.get(name) for name in upstream[entry["name"]] if name in selected_names]
+                    if any(value in ("failed", "skipped") for value in needed):
+                        status[entry["name"]] = "skipped"
+                        waiting.remove(entry)
+                        continue
+                    if any(value is None for value in needed):
+                        continue
+                    waiting.remove(entry)
+                    if entry["name"] not in force and is_fresh(entry, state):
+                        status[entry["name"]] = "fresh"
+                        continue
+                    if executor is None:
+                        try:
+                            _run_stage(entry)
+                            finish(entry, None)
+                        except Exception as error:
+                            finish(entry, error)
+                        continue
+                    future = executor.submit(parallel_regions._traced_task, _run_stage, (entry,)) if traced else executor.submit(_run_stage, entry)
+                    running[future] = entry
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entry = running.pop(future)
+                    error = future.exception()
+                    if error is None and traced:
+                        instrumentation.merge(future.result()[1])
+                    finish(entry, error)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return status
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the stale stages of the dam loss workflow")
+    parser.add_argument("--dry-run", action="store_true", help="list the stale stages without running them")
+    parser.add_argument("--force", nargs="+", default=[], help="stages to rerun even when fresh")
+    parser.add_argument("--targets", nargs="+", default=None, help="only build these stages and what they depend on")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--state", default=STATE_FILE)
+    args = parser.parse_args()
+
+    stages = workflow()
+    if args.dry_run:
+        for name, value in plan(stages, args.state, args.force, args.targets).items():
+            print(f"{value:7} {name}")
+        return 0
+    status = run(stages, args.state, args.workers, force=args.force, targets=args.targets)
+    counts = pd.Series(status).value_counts()
+    print(counts.to_string())
+    return 1 if "failed" in counts.index else 0
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,98 @@
+#expected loss histograms for the assessment and frequency scenarios
+#the numeric pipeline only bins the data with np.histogram, the figures are drawn and saved by a background process pool
+#with the object oriented Figure API, so no pyplot global state is shared and the pipeline does not wait for the pngs
+#call wait() to block until every queued chart is written, the pool also finishes its queue before the process exits
+#matplotlib is only imported by the render processes and always with the non interactive Agg backend, so they never need a display,
+#and when tracing is on their plot.histogram spans come back with the charts and are merged into this process's trace
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import instrumentation
+
+#background processes drawing the queued charts
+RENDER_WORKERS = min(2, os.cpu_count() or 1)
+BINS = 50
+
+_executor = None
+_pending = []
+
+def shared_bins(baseline, scenarios : list, bins : int = BINS) -> dict:
+    #one set of bin edges over the baseline and every scenario, so all of a region's charts are comparable
+    #the baseline's counts are computed once and reused by every scenario's chart
+    baseline = np.asarray(baseline, dtype=np.float64)
+    values = np.concatenate([baseline] + [np.asarray(scenario, dtype=np.float64) for scenario in scenarios])
+    edges = np.histogram_bin_edges(values[np.isfinite(values)], bins)
+    return {"edges" : edges, "baseline" : np.histogram(baseline, edges)[0]}
+
+def _initialise_renderer(traced : bool):
+    import matplotlib
+    matplotlib.use("Agg")
+    #a forked renderer holds a copy of the parent's events, only its own are sent back
+    instrumentation.reset()
+    if traced:
+        instrumentation.enable(None)
+
+def _render(file : str, edges : np.ndarray, counts : list, labels : list, title : str, xlabel : str, ylabel : str) -> tuple:
+    #returns the file name and the events recorded while drawing it
+    from matplotlib.figure import Figure
+    with instrumentation.span("plot.histogram", file=file):
+        figure = Figure()
+        axes = figure.subplots()
+        #one bar group per bin, weighted by the precomputed counts, looks the same as hist on the raw values
+        axes.hist([edges[:-1]] * len(counts), bins=edges, weights=counts, label=labels)
+        axes.set_xlabel(xlabel)
+        axes.set_ylabel(ylabel)
+        axes.set_title(title)
+        axes.legend()
+        figure.savefig(file)
+    return file, instrumentation.collect()
+
+def submit(file : str, edges : np.ndarray, counts : list, labels : list, title : str, xlabel : str = "Expected Loss Value, millions(£Q)", ylabel : str = "Number of Dams"):
+    #queues one chart and returns its future straight away, the future's result is (file name, trace events)
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS, initializer=_initialise_renderer, initargs=(instrumentation.ENABLED,))
+    instrumentation.count("plot.queued")
+    future = _executor.submit(_render, file, edges, counts, labels, title, xlabel, ylabel)
+    _pending.append(future)
+    return future
+
+def wait() -> list:
+    #blocks until every queued chart is saved and returns their file names, re-raises the first rendering error
+    with instrumentation.span("plot.wait", charts=len(_pending)):
+        futures = _pending[:]
+        _pending.clear()
+        files = []
+        for future in futures:
+            file, events = future.result()
+            instrumentation.merge(events)
+            files.append(file)
+        return files
+
+def shutdown() -> list:
+    #wait() and then stop the render processes, pool workers must call this before they exit
+    #because a process pool left running inside another pool's worker keeps that worker from exiting
+    global _executor
+    files = wait()
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+    return files
+
+def assessment_histogram(old_expected_loss, new_expected_loss, region : str, assessment : str, replace_all : bool, export : bool, bins : dict = None):
+    #nothing is drawn unless the chart is exported
+    if not export:
+        return None
+    bins = bins or shared_bins(old_expected_loss, [new_expected_loss])
+    counts = np.histogram(new_expected_loss, bins["edges"])[0]
+    return submit(f"assessment_adjusted_expected_loss__{region}_histogram_{assessment}_Replaced_All_is_{replace_all}.png", bins["edges"], [bins["baseline"], counts],
+                  ["Original", "After Frequency Change"], f"Reduction to losses by change in assessment in {region}")
+
+def frequency_histogram(old_expected_loss, new_expected_loss, region : str, frequency : int, bins : dict = None):
+    #losses are shown per year, bins built by shared_bins must come from the yearly values too
+    old_expected_loss = np.asarray(old_expected_loss) / 10
+    new_expected_loss = np.asarray(new_expected_loss) / 10
+    bins = bins or shared_bins(old_expected_loss, [new_expected_loss])
+    counts = np.histogram(new_expected_loss, bins["edges"])[0]
+    return submit(f"frequency_adjusted_expected_loss_{frequency}_{region}_histogram.png", bins["edges"], [bins["baseline"], counts],
+                  ["Original", "After Frequency Change"], f"Reduction to losses by increased inspection frequency in {region}")
@@ -0,0 +1,138 @@
+#searches the inspection policy that reaches a target government percentile or threshold shift
+#instead of sweeping every minimum frequency, a coarse scan finds the first cell reaching the target, only that cell is searched further and every probe is memoized,
+#so a question like "what frequency hits 97%?" costs a handful of incremental model evaluations
+#usage:
+#   solver = policy_solver.make_solver("dam_data_imputed_flumevale.csv")
+#   result = policy_solver.solve(solver, target_percentile=95.5)
+import math
+import numpy as np
+import pandas as pd
+import gov_expenditure
+import incremental_scoring
+import machine_learning
+import model_factory
+import portfolio
+
+#mode -> (variant builder, default search range, whether settings are whole numbers)
+MODES = {
+    "minimum" : (machine_learning.frequency_variants, (0, 10), True),
+    "multiplier" : (machine_learning.multiplier_variants, (1.0, 4.0), False),
+}
+
+def make_solver(data, mode : str = "minimum", initial_percentile : float = 95, profile : str = model_factory.FINAL_PROFILE) -> dict:
+    #trains (or loads) the region's model once and caches its baseline predictions, data is a csv path or a DataFrame
+    #mode "minimum" raises every inspection frequency to at least the setting, "multiplier" scales every frequency by it
+    #the probes train with the ydf defaults unless profile picks another model_factory profile, EXPLORATORY_PROFILE is much quicker
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {list(MODES)}, got {mode!r}")
+    df = gov_expenditure.load_frame(data)
+    model = machine_learning.train_model(df, profile)
+    #the solver keeps the baseline features for its whole life, so they are held in the compact dtypes
+    df = portfolio.compact_frame(df)
+    return {
+        "mode" : mode,
+        "region" : df["Region"].iloc[0],
+        "initial_percentile" : initial_percentile,
+        "baseline" : incremental_scoring.baseline_scores(df, model, machine_learning.DROPPED_COLUMNS, model_factory.thread_count()),
+        "old_data" : gov_expenditure.yearly_moments(df),
+        #setting -> threshold_statistics, shared by every solve on this solver
+        "memo" : {},
+        "evaluations" : 0,
+    }
+
+def evaluate(solver : dict, setting : float) -> dict:
+    #threshold_statistics for one setting, only the changed dams are predicted and each setting is predicted at most once
+    if setting in solver["memo"]:
+        return solver["memo"][setting]
+    build_variants = MODES[solver["mode"]][0]
+    baseline = solver["baseline"]
+    [(rows, features)] = build_variants(baseline, [setting])
+    [new_probability] = incremental_scoring.score_variants(baseline, [(rows, features)])
+    new_data = gov_expenditure.yearly_tuple(incremental_scoring.variant_moments(baseline, rows, new_probability))
+    statistics = gov_expenditure.threshold_statistics(solver["old_data"], new_data, solver["initial_percentile"], solver["region"], False)
+    solver["evaluations"] += 1
+    solver["memo"][setting] = statistics
+    return statistics
+
+def scan_settings(lower : float, upper : float, points : int, whole : bool) -> list:
+    #evenly spaced settings from lower to upper, both ends included
+    settings = np.linspace(lower, upper, max(points, 2))
+    if whole:
+        settings = np.unique(np.rint(settings).astype(int))
+    return [setting.item() for setting in settings]
+
+def _first_reached(probe, reached, low : float, high : float, whole : bool, tolerance : float, scan_points : int) -> float:
+    #smallest setting in (low, high] that reaches the target, probe(high) is known to reach it
+    #bisection could step over an earlier crossing of a non monotone response, so the cell is scanned in increasing order instead
+    if whole:
+        for setting in range(int(low) + 1, int(high) + 1):
+            if reached(probe(setting)):
+                return setting
+        return high
+    while high - low > tolerance:
+        for setting in np.linspace(low, high, max(scan_points, 3))[1:-1].tolist():
+            if reached(probe(setting)):
+                high = setting
+                break
+            low = setting
+    return high
+
+def solve(solver : dict, target_percentile : float = None, target_shift : float = None, lower : float = None, upper : float = None, tolerance : float = 0.01, scan_points : int = 5) -> dict:
+    #smallest setting in [lower, upper] whose "Threshold percent" reaches target_percentile (in percent, like initial_percentile)
+    #or whose "Change in Threshold" reaches target_shift, reaching means crossing the target coming from the value at lower
+    #the model's response is not monotone in the frequency, so a coarse scan finds the first cell where the target is reached
+    #and that cell is scanned again from its low end: whole settings are checked one by one, so the first crossing in the cell is exact,
+    #other settings are refined by repeated scans of scan_points until the cell is narrower than tolerance
+    #a crossing between two coarse scan points that both miss the target is only found with more scan_points
+    #setting is None when no scanned setting reaches the target
+    if (target_percentile is None) == (target_shift is None):
+        raise ValueError("give exactly one of target_percentile and target_shift")
+    _, (default_lower, default_upper), whole = MODES[solver["mode"]]
+    lower = default_lower if lower is None else lower
+    upper = default_upper if upper is None else upper
+    if target_percentile is not None:
+        column, target = f"Threshold percent {solver['region']}", target_percentile / 100
+    else:
+        column, target = f"Change in Threshold {solver['region']}", target_shift
+
+    trace = []
+    def probe(setting):
+        cached = setting in solver["memo"]
+        value = evaluate(solver, setting)[column]
+        trace.append({"probe" : len(trace), "setting" : setting, "value" : value, "cached" : cached})
+        return value
+
+    start = probe(lower)
+    increasing = target >= start
+    def reached(value):
+        return value >= target if increasing else value <= target
+
+    setting = lower if reached(start) else None
+    previous = lower
+    for candidate in scan_settings(lower, upper, scan_points, whole)[1:]:
+        if setting is not None:
+            break
+        if not reached(probe(candidate)):
+            previous = candidate
+            continue
+        #every scanned setting up to previous misses the target, the first one reaching it is inside (previous, candidate]
+        setting = _first_reached(probe, reached, previous, candidate, whole, tolerance, scan_points)
+
+    trace = pd.DataFrame(trace)
+    trace["reached"] = [reached(value) for value in trace["value"]]
+    return {
+        "setting" : setting,
+        "value" : math.nan if setting is None else solver["memo"][setting][column],
+        "statistics" : None if setting is None else solver["memo"][setting],
+        "trace" : trace,
+        "evaluations" : solver["evaluations"],
+    }
+
+if __name__ == "__main__":
+    import ydf
+    ydf.verbose(0)
+    for file in ["dam_data_imputed_flumevale.csv", "dam_data_imputed_lyndrassia.csv", "dam_data_imputed_navaldia.csv"]:
+        solver = make_solver(file)
+        result = solve(solver, target_percentile=95.5)
+        print(f"{solver['region']}: minimum frequency {result['setting']} reaches {result['value']} after {result['evaluations']} model evaluations")
+        print(result["trace"])
@@ -0,0 +1,86 @@
+#compact in-memory form of a region's dam data for running many scenarios at once
+#categorical columns are held as int8/int16 codes plus their labels, numeric columns in the narrowest dtype that holds every value exactly
+#(float32 when nothing is lost, otherwise float64), so predictions, moments and exports are unchanged
+#scenario variants only replace the columns they change and share every other array with the portfolio they came from
+import numpy as np
+import pandas as pd
+from dam_dataset import CATEGORICAL_COLUMNS
+
+def _code_dtype(categories : int):
+    for dtype in (np.int8, np.int16):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int32
+
+def _narrow(values : np.ndarray) -> np.ndarray:
+    #float32 when the round trip is exact, integer columns keep their kind in the smallest integer type that fits
+    if values.dtype.kind in "iu":
+        if values.size == 0:
+            return values
+        for dtype in (np.int8, np.int16, np.int32):
+            if np.iinfo(dtype).min <= values.min() and values.max() <= np.iinfo(dtype).max:
+                return values.astype(dtype)
+        return values
+    if values.dtype.kind == "f" and values.dtype.itemsize > 4:
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed, values, equal_nan=True):
+            return narrowed
+    return values
+
+def from_frame(df : pd.DataFrame, categorical_columns : list = CATEGORICAL_COLUMNS) -> dict:
+    #returns {"columns": {name: array}, "categories": {name: labels}, "rows": n}, codes are -1 where the value is missing
+    columns = {}
+    categories = {}
+    for name in df.columns:
+        values = df[name]
+        if name in categorical_columns or isinstance(values.dtype, pd.CategoricalDtype):
+            categorical = values.array if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+            categories[name] = categorical.categories
+            columns[name] = categorical.codes.astype(_code_dtype(len(categorical.categories)))
+        elif pd.api.types.is_bool_dtype(values.dtype) or not pd.api.types.is_numeric_dtype(values.dtype):
+            columns[name] = values.to_numpy()
+        else:
+            columns[name] = _narrow(values.to_numpy())
+    return {"columns" : columns, "categories" : categories, "rows" : len(df)}
+
+def variant(portfolio : dict, replacements : dict) -> dict:
+    #a scenario of portfolio with the replaced columns swapped in, the other arrays are shared, not copied
+    for name, values in replacements.items():
+        if name in portfolio["categories"]:
+            raise ValueError(f"'{name}' is categorical, replace its codes with encode() first")
+        if len(values) != portfolio["rows"]:
+            raise ValueError(f"'{name}' has {len(values)} values for {portfolio['rows']} rows")
+    return {"columns" : portfolio["columns"] | replacements, "categories" : portfolio["categories"], "rows" : portfolio["rows"]}
+
+def encode(portfolio : dict, name : str, labels) -> np.ndarray:
+    #codes of labels in a categorical column, labels the column has never held are a ValueError
+    codes = portfolio["categories"][name].get_indexer(pd.Index(np.atleast_1d(labels)))
+    if (codes < 0).any():
+        raise ValueError(f"'{name}' has no category {np.atleast_1d(labels)[codes < 0].tolist()}")
+    return codes.astype(portfolio["columns"][name].dtype)
+
+def to_frame(portfolio : dict, columns : list = None, drop : list = ()) -> pd.DataFrame:
+    #DataFrame view of the portfolio for ydf and the moment functions, the arrays are wrapped without copying
+    #categorical columns come back as pandas categoricals over the stored codes
+    names = [name for name in (columns if columns is not None else portfolio["columns"]) if name not in drop]
+    data = {}
+    for name in names:
+        values = portfolio["columns"][name]
+        if name in portfolio["categories"]:
+            values = pd.Categorical.from_codes(values, categories=portfolio["categories"][name], validate=False)
+        data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+def compact_frame(df : pd.DataFrame) -> pd.DataFrame:
+    #df with the same values held in the compact dtypes
+    return to_frame(from_frame(df))
+
+def nbytes(portfolio : dict) -> int:
+    #memory held by the arrays, counting text columns by their python objects
+    total = 0
+    for name, values in portfolio["columns"].items():
+        if values.dtype == object:
+            total += int(pd.Series(values).memory_usage(deep=True, index=False))
+        else:
+            total += values.nbytes
+    return total
@@ -0,0 +1,64 @@
+#splits a dam registry csv into one csv per region in two streaming passes, one for the column dtypes and one for the rows
+#the source is read in chunks and each chunk's rows are appended to their region's file, so memory is bounded by the chunk size
+#values are written with the dtypes a whole-file pd.read_csv infers, found in a first pass over the chunks,
+#so the files match the original two.py split (which wrote read_csv's frame back out) byte for byte
+import os
+import pandas as pd
+import instrumentation
+
+CHUNK_ROWS = 100_000
+
+def region_file(region : str, output_dir : str = ".") -> str:
+    return os.path.join(output_dir, f"dam_data_{str(region).lower()}.csv")
+
+def _column_dtypes(source : str, chunk_rows : int) -> dict:
+    #the dtype pd.read_csv would give every column if it read the whole file at once
+    kinds = {}
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        for column, dtype in chunk.dtypes.items():
+            kinds.setdefault(column, set()).add(dtype.kind)
+    dtypes = {}
+    for column, found in kinds.items():
+        if found == {"i"}:
+            dtypes[column] = "int64"
+        elif found <= {"i", "f"}:
+            #a chunk with missing values turns an integer column into floats, and so does the whole file
+            dtypes[column] = "float64"
+        elif found == {"b"}:
+            dtypes[column] = "bool"
+        else:
+            dtypes[column] = "str"
+    return dtypes
+
+def split_regions(source : str, output_dir : str = ".", regions : list = None, column : str = "Region", chunk_rows : int = CHUNK_ROWS) -> dict:
+    #returns {region: rows written}
+    #regions=None writes every region found in the source, otherwise only the listed ones (each gets a file even when empty)
+    #rows without a region are not written anywhere
+    os.makedirs(output_dir, exist_ok=True)
+    header = pd.read_csv(source, nrows=0).columns
+    files = {}
+    counts = {}
+    try:
+        with instrumentation.span("csv.split", file=source):
+            dtypes = _column_dtypes(source, chunk_rows)
+            for chunk in pd.read_csv(source, dtype=dtypes, chunksize=chunk_rows):
+                instrumentation.count("csv.rows_read", len(chunk))
+                for region, rows in chunk.groupby(column, sort=False):
+                    if regions is not None and region not in regions:
+                        continue
+                    if region not in files:
+                        files[region] = open(region_file(region, output_dir), "w", newline="")
+                        rows.to_csv(files[region], index=False)
+                    else:
+                        rows.to_csv(files[region], index=False, header=False)
+                    counts[region] = counts.get(region, 0) + len(rows)
+            #listed regions that never appeared still get a file with just the header
+            for region in regions or []:
+                if region not in files:
+                    with open(region_file(region, output_dir), "w", newline="") as file:
+                        pd.DataFrame(columns=header).to_csv(file, index=False)
+                    counts[region] = 0
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
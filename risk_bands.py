@@ -0,0 +1,128 @@
+#precomputed risk-band index of a region for scanning many percentile bands and top-k slices
+#the dams are sorted by expected loss once (ascending for percentile bands, descending for top-k like portfolio_moments),
+#with prefix sums of expected loss, total loss given failure and per dam variance along each order,
+#so every band's moments are two lookups and a subtraction instead of a sort and a sum
+#when some dams' probabilities of failure change, update() moves only those dams and redoes the prefix sums from the first moved position
+#the moments equal gov_expenditure.portfolio_moments on the same band up to floating point rounding, the rows are identical
+#gov_expenditure.frame_moments, and with it every band helper there, answers from this index
+import math
+import numpy as np
+import pandas as pd
+import gov_expenditure
+
+def _terms(probability : np.ndarray, total_loss : np.ndarray, expected_loss : np.ndarray) -> dict:
+    #per dam values the prefix sums are built from
+    return {"expected_value" : expected_loss, "total_loss" : total_loss, "variance" : probability * total_loss * total_loss - expected_loss * expected_loss}
+
+def _prefix(values : np.ndarray, order : np.ndarray) -> np.ndarray:
+    #prefix[i] is the sum of the first i dams along order
+    prefix = np.zeros(order.size + 1)
+    np.cumsum(values[order], out=prefix[1:])
+    return prefix
+
+def build_index(probability : np.ndarray, total_loss : np.ndarray, expected_loss : np.ndarray = None) -> dict:
+    #expected_loss defaults to probability * total_loss, pass the Expected Loss Value column to sort exactly like frame_moments
+    probability = np.array(probability, dtype=np.float64)
+    total_loss = np.array(total_loss, dtype=np.float64)
+    expected_loss = probability * total_loss if expected_loss is None else np.array(expected_loss, dtype=np.float64)
+    terms = _terms(probability, total_loss, expected_loss)
+    index = {"probability" : probability, "total_loss" : total_loss, "terms" : terms}
+    for name, order in (("ascending", np.argsort(expected_loss, kind="stable")), ("descending", np.argsort(-expected_loss, kind="stable"))):
+        index[name] = {"order" : order, "prefix" : {key : _prefix(values, order) for key, values in terms.items()}}
+    return index
+
+def frame_index(df : pd.DataFrame) -> dict:
+    return build_index(df[gov_expenditure.PROBABILITY_COLUMN].to_numpy(), df[gov_expenditure.LOSS_COLUMN].to_numpy(), df[gov_expenditure.EXPECTED_COLUMN].to_numpy())
+
+def _moments(direction : dict, lower_bound : int, upper_bound : int) -> dict:
+    prefix = direction["prefix"]
+    count = upper_bound - lower_bound
+    expected_value = float(prefix["expected_value"][upper_bound] - prefix["expected_value"][lower_bound])
+    variance = float(prefix["variance"][upper_bound] - prefix["variance"][lower_bound])
+    return {
+        "rows" : direction["order"][lower_bound:upper_bound],
+        "count" : count,
+        "total_loss" : float(prefix["total_loss"][upper_bound] - prefix["total_loss"][lower_bound]),
+        "expected_value" : expected_value,
+        "mean" : expected_value / count if count else math.nan,
+        "variance" : variance,
+        "standard_deviation" : math.sqrt(max(variance, 0.0)),
+    }
+
+def band(index : dict, lower_percentile : float = 0, upper_percentile : float = 100) -> dict:
+    #portfolio_moments of the [lower_percentile, upper_percentile) band, rows is a view into the sort order
+    lower_bound, upper_bound = gov_expenditure.band_bounds(index["ascending"]["order"].size, lower_percentile, upper_percentile)
+    return _moments(index["ascending"], lower_bound, max(lower_bound, upper_bound))
+
+def top(index : dict, count : int) -> dict:
+    #portfolio_moments of the count dams with the largest expected loss
+    return _moments(index["descending"], 0, min(max(count, 0), index["descending"]["order"].size))
+
+def band_table(index : dict, lower_percentiles, upper_percentiles, annual_scale : float = 10) -> pd.DataFrame:
+    #moments of many bands at once, one row per (lower, upper) pair, with the yearly expected value and standard deviation of yearly_tuple
+    lower_percentiles = np.asarray(lower_percentiles, dtype=np.float64)
+    upper_percentiles = np.asarray(upper_percentiles, dtype=np.float64)
+    size = index["ascending"]["order"].size
+    #same truncation as band_bounds, done for every band together
+    lower_bounds = (size * lower_percentiles / 100).astype(np.intp)
+    upper_bounds = np.maximum((size * upper_percentiles / 100).astype(np.intp), lower_bounds)
+    prefix = index["ascending"]["prefix"]
+    sums = {key : values[upper_bounds] - values[lower_bounds] for key, values in prefix.items()}
+    count = upper_bounds - lower_bounds
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums["expected_value"] / count
+    return pd.DataFrame({
+        "lower_percentile" : lower_percentiles,
+        "upper_percentile" : upper_percentiles,
+        "count" : count,
+        "total_loss" : sums["total_loss"],
+        "expected_value" : sums["expected_value"],
+        "mean" : mean,
+        "variance" : sums["variance"],
+        "yearly_expected_value" : sums["expected_value"] / annual_scale,
+        "yearly_standard_deviation" : np.sqrt(np.maximum(sums["variance"], 0) / annual_scale),
+    })
+
+def _reorder(order : np.ndarray, keys : np.ndarray, rows : np.ndarray) -> tuple:
+    #order with rows moved to where their new keys belong, ties broken by dam position like a stable argsort
+    #returns the new order and the first position that changed
+    moved = np.zeros(keys.size, dtype=bool)
+    moved[rows] = True
+    in_order = moved[order]
+    kept = order[~in_order]
+    kept_keys = keys[kept]
+    rows = rows[np.lexsort((rows, keys[rows]))]
+    left = np.searchsorted(kept_keys, keys[rows], side="left")
+    right = np.searchsorted(kept_keys, keys[rows], side="right")
+    #equal keys: kept dams within a tie are in position order, so a binary search on positions finds the slot
+    for position in np.flatnonzero(right > left):
+        left[position] += np.searchsorted(kept[left[position]:right[position]], rows[position])
+    new_order = np.insert(kept, left, rows)
+    removed = np.flatnonzero(in_order)
+    first = int(min(left.min(), removed.min())) if rows.size else order.size
+    return new_order, first
+
+def update(index : dict, rows : np.ndarray, new_probability : np.ndarray, new_expected_loss : np.ndarray = None) -> dict:
+    #index after the dams at rows get new probabilities of failure, the old index is left as it was
+    #only the changed dams are re-placed in each order and the prefix sums are recomputed from the first position that moved
+    #a dam listed twice keeps its last value
+    rows = np.asarray(rows, dtype=np.intp)
+    rows, last = np.unique(rows[::-1], return_index=True)
+    unique = np.asarray(new_probability).size - 1 - last
+    new_probability = np.asarray(new_probability, dtype=np.float64)[unique]
+    probability = index["probability"].copy()
+    probability[rows] = new_probability
+    total_loss = index["total_loss"]
+    terms = {key : values.copy() for key, values in index["terms"].items()}
+    terms["expected_value"][rows] = new_probability * total_loss[rows] if new_expected_loss is None else np.asarray(new_expected_loss, dtype=np.float64)[unique]
+    expected_loss = terms["expected_value"]
+    terms["variance"][rows] = new_probability * total_loss[rows] * total_loss[rows] - expected_loss[rows] * expected_loss[rows]
+    result = {"probability" : probability, "total_loss" : total_loss, "terms" : terms}
+    for name, keys in (("ascending", expected_loss), ("descending", -expected_loss)):
+        order, first = _reorder(index[name]["order"], keys, rows)
+        prefix = {}
+        for key, values in terms.items():
+            prefix[key] = index[name]["prefix"][key].copy()
+            prefix[key][first + 1:] = prefix[key][first] + np.cumsum(values[order[first:]])
+        result[name] = {"order" : order, "prefix" : prefix}
+    return result
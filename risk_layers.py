@@ -0,0 +1,110 @@
+#layered risk transfer: direct insurers, reinsurers and the government each pay a tranche of every loss
+#a layer structure is a dict of names with attachment and detachment points, taken either from the three.py break-even analysis
+#or from the government threshold and reserve of gov_expenditure, and losses are split into every tranche with one broadcast
+#losses are either per dam (pass their probabilities of failure) or per simulated year (loss_simulation.annual_losses)
+import numpy as np
+import pandas as pd
+from loss_statistics import sorted_quantiles
+
+#break-even cost model of three.py, in million £
+INSURER_BASE_RATE = 0.05
+INSURER_SPIKE_THRESHOLD = 1
+INSURER_CURVATURE = 0.5
+REINSURER_BASE_RATE = 0.2
+REINSURER_SUSTAINABLE_THRESHOLD = 50
+REINSURER_CURVATURE = 0.8
+INSURER_SUSTAINABLE_LIMIT = 1.0
+REINSURER_SUSTAINABLE_LIMIT = 20.0
+#largest claim size the break-even analysis considers
+MAX_CLAIM_SIZE = 100
+TAIL_QUANTILES = [0.95, 0.99, 0.997]
+
+def insurer_cost(claim_size):
+    # Direct insurers: Lower cost per claim, high frequency, slight increase until spike
+    claim_size = np.asarray(claim_size, dtype=np.float64)
+    base_cost = INSURER_BASE_RATE * claim_size
+    return base_cost + np.where(claim_size <= INSURER_SPIKE_THRESHOLD, 0, INSURER_CURVATURE * (claim_size - INSURER_SPIKE_THRESHOLD)**2)
+
+def reinsurer_cost(claim_size):
+    # Reinsurers: Higher cost per claim, lower frequency, steeper curve
+    claim_size = np.asarray(claim_size, dtype=np.float64)
+    base_cost = REINSURER_BASE_RATE * claim_size
+    return base_cost + np.where(claim_size <= REINSURER_SUSTAINABLE_THRESHOLD, 0, REINSURER_CURVATURE * (claim_size - REINSURER_SUSTAINABLE_THRESHOLD)**2)
+
+def break_even(cost, limit : float, low : float = 0, high : float = MAX_CLAIM_SIZE) -> float:
+    #claim size where an increasing cost function reaches limit, found with brentq instead of scanning a grid
+    #like three.py, high is returned when the cost never passes the limit
+    from scipy.optimize import brentq
+    if cost(low) >= limit:
+        return low
+    if cost(high) <= limit:
+        return high
+    return brentq(lambda claim_size: float(cost(claim_size)) - limit, low, high)
+
+def structure(names : list, attachments : list, detachments : list = None) -> dict:
+    #detachments default to the next layer's attachment, the last layer is unlimited
+    attachments = np.asarray(attachments, dtype=np.float64)
+    if detachments is None:
+        detachments = np.append(attachments[1:], np.inf)
+    detachments = np.asarray(detachments, dtype=np.float64)
+    if len(names) != attachments.size or attachments.size != detachments.size:
+        raise ValueError("every layer needs a name, an attachment and a detachment point")
+    if np.any(detachments < attachments):
+        raise ValueError("a layer detaches below its attachment point")
+    return {"names" : list(names), "attachments" : attachments, "detachments" : detachments}
+
+def break_even_structure(insurer_limit : float = INSURER_SUSTAINABLE_LIMIT, reinsurer_limit : float = REINSURER_SUSTAINABLE_LIMIT) -> dict:
+    #three.py's split: insurers up to their break-even claim size, reinsurers up to theirs and the government above
+    insurer_threshold = break_even(insurer_cost, insurer_limit)
+    reinsurer_threshold = break_even(reinsurer_cost, reinsurer_limit)
+    return structure(["Direct Insurers", "Reinsurers", "Government"], [0, insurer_threshold, reinsurer_threshold])
+
+def government_structure(gov_threshold : float, gov_reserve : float) -> dict:
+    #annual losses below the threshold stay with the insurers, the government pays up to threshold + reserve and the rest is uncovered
+    #the two points come from gov_expenditure.government_layer
+    return structure(["Insurers", "Government", "Uncovered"], [0, gov_threshold, gov_threshold + gov_reserve])
+
+def allocate(losses : np.ndarray, layers : dict) -> np.ndarray:
+    #losses x layers matrix of what every layer pays, rows sum back to the loss (clipped at the top layer's detachment)
+    losses = np.asarray(losses, dtype=np.float64)
+    width = layers["detachments"] - layers["attachments"]
+    return np.clip(losses[:, None] - layers["attachments"], 0, width)
+
+def layer_metrics(losses : np.ndarray, layers : dict, probability : np.ndarray = None, quantiles : list = TAIL_QUANTILES) -> pd.DataFrame:
+    #one row per layer with its expected cost, share of the expected loss, how often it is hit or exhausted and its tail metrics
+    #with probability the losses are per dam and expected_cost is sum(probability * tranche) over the portfolio,
+    #without it they are equally likely outcomes (simulated years) and expected_cost is their mean
+    #probability_attached and probability_exhausted are then the expected number of failures reaching or exhausting the layer
+    #the tail metrics are quantiles (value_at_risk_<q>) and the mean beyond the highest quantile (tail_value_at_risk) over the outcomes,
+    #they are left out for per dam losses, whose quantiles would count every dam the same whatever its probability of failure,
+    #pass loss_simulation.annual_losses of the portfolio to get them
+    losses = np.asarray(losses, dtype=np.float64)
+    order = np.argsort(losses, kind="stable")
+    losses = losses[order]
+    if probability is not None:
+        probability = np.asarray(probability, dtype=np.float64)[order]
+    tranches = allocate(losses, layers)
+    weights = probability if probability is not None else np.full(losses.size, 1 / max(losses.size, 1))
+    expected = weights @ tranches
+    total_expected = float(weights @ losses)
+    #every tranche is a non decreasing function of the loss, so the sorted losses give each layer's sorted values
+    tail_start = int(np.floor((losses.size - 1) * max(quantiles))) if losses.size else 0
+    rows = []
+    for position, name in enumerate(layers["names"]):
+        values = tranches[:, position]
+        row = {
+            "layer" : name,
+            "attachment" : layers["attachments"][position],
+            "detachment" : layers["detachments"][position],
+            "expected_cost" : float(expected[position]),
+            "share_of_expected_loss" : float(expected[position] / total_expected) if total_expected else np.nan,
+            "probability_attached" : float(weights @ (losses > layers["attachments"][position])),
+            "probability_exhausted" : float(weights @ (losses >= layers["detachments"][position])),
+        }
+        if probability is None:
+            row["maximum"] = float(values[-1]) if values.size else np.nan
+            for quantile, value in zip(quantiles, sorted_quantiles(values, quantiles)):
+                row[f"value_at_risk_{quantile:g}"] = float(value)
+            row["tail_value_at_risk"] = float(values[tail_start:].mean()) if values.size else np.nan
+        rows.append(row)
+    return pd.DataFrame(rows)
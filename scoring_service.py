@@ -0,0 +1,247 @@
+#long running what-if scoring service on localhost: "what if this dam were reassessed as Fair, or inspected every 5 years?"
+#every region's model is loaded (or trained once into the model store) at start up together with its baseline predictions,
+#a scenario then only predicts the dams it changes and updates the portfolio moments from them, like incremental_scoring does for sweeps
+#"portfolio" compares the scenario with the recorded losses as machine_learning.frequency_sweep does, so its figures match machine_learning's,
+#"portfolio_against_model_baseline" compares it with the model's own unchanged predictions, where an empty scenario shifts nothing
+#requests arriving together are coalesced by one batching thread into a single model.predict per region
+#usage: python scoring_service.py [--port 8765] [--profile accurate] [region files]
+#   POST /score {"region": "Flumevale", "changes": [{"ID": "SOAD00123", "Assessment": "Fair"}, {"ID": "SOAD00456", "Inspection Frequency": 5}]}
+#   POST /score {"scenarios": [<scenario>, ...]} answers several independent scenarios at once, GET /health lists the regions
+import argparse
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import gov_expenditure
+import incremental_scoring
+import instrumentation
+import machine_learning
+import model_factory
+import portfolio
+
+HOST = "127.0.0.1"
+PORT = 8765
+#features a scenario may change
+EDITABLE_COLUMNS = ["Assessment", "Inspection Frequency"]
+#how long the batching thread waits for more requests after the first one, and the most changed dams it predicts at once
+BATCH_WINDOW_SECONDS = 0.005
+MAX_BATCH_ROWS = 100_000
+INITIAL_PERCENTILE = 95
+
+def load_region(data, profile : str = model_factory.FINAL_PROFILE, initial_percentile : float = INITIAL_PERCENTILE) -> dict:
+    #model, cached baseline predictions and moments of one region, data is a csv path or a DataFrame
+    df = gov_expenditure.load_frame(data)
+    model = machine_learning.train_model(df, profile)
+    df = portfolio.compact_frame(df)
+    baseline = incremental_scoring.baseline_scores(df, model, machine_learning.DROPPED_COLUMNS, model_factory.thread_count())
+    return {
+        "region" : str(df["Region"].iloc[0]),
+        "baseline" : baseline,
+        "ids" : pd.Index(df["ID"].astype(str)),
+        "assessments" : set(baseline["features"]["Assessment"].dropna().astype(str)),
+        #the recorded Expected Loss Value, machine_learning's reference
+        "old_data" : gov_expenditure.yearly_moments(df),
+        #the model's own unchanged predictions
+        "model_old_data" : gov_expenditure.yearly_tuple(incremental_scoring.baseline_moments(baseline)),
+        "initial_percentile" : initial_percentile,
+    }
+
+def scenario_variant(region : dict, changes : list) -> tuple:
+    #(rows, features) of the dams a scenario changes, a dam listed twice keeps its last change
+    #unknown dams, columns or assessment levels are a ValueError
+    updates = {}
+    for change in changes:
+        change = dict(change)
+        dam = str(change.pop("ID", change.pop("id", "")))
+        unknown = [column for column in change if column not in EDITABLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"only {EDITABLE_COLUMNS} can be changed, got {unknown}")
+        if "Assessment" in change and str(change["Assessment"]) not in region["assessments"]:
+            raise ValueError(f"'{change['Assessment']}' is not an assessment level of {region['region']}, use one of {sorted(region['assessments'])}")
+        if "Inspection Frequency" in change:
+            change["Inspection Frequency"] = float(change["Inspection Frequency"])
+            if not np.isfinite(change["Inspection Frequency"]) or change["Inspection Frequency"] < 0:
+                raise ValueError(f"inspection frequency of {dam} must be a non negative number")
+        updates.setdefault(dam, {}).update(change)
+    dams = list(updates)
+    rows = region["ids"].get_indexer(dams)
+    if (rows < 0).any():
+        raise ValueError(f"{region['region']} has no dams {[dam for dam, row in zip(dams, rows) if row < 0]}")
+    features = region["baseline"]["features"].iloc[rows].copy()
+    for column in EDITABLE_COLUMNS:
+        values = features[column].to_numpy(dtype=object if column == "Assessment" else np.float64).copy()
+        for position, dam in enumerate(dams):
+            if column in updates[dam]:
+                values[position] = updates[dam][column]
+        features[column] = values
+    return rows, features
+
+def scenario_result(region : dict, rows : np.ndarray, new_probability : np.ndarray) -> dict:
+    #per dam probabilities and expected losses before and after, with the portfolio threshold shift against both references
+    baseline = region["baseline"]
+    new_data = gov_expenditure.yearly_tuple(incremental_scoring.variant_moments(baseline, rows, new_probability))
+    statistics = gov_expenditure.threshold_statistics(region["old_data"], new_data, region["initial_percentile"], region["region"], False)
+    model_statistics = gov_expenditure.threshold_statistics(region["model_old_data"], new_data, region["initial_percentile"], region["region"], False)
+    total_loss = baseline["total_loss"][rows]
+    dams = pd.DataFrame({
+        "ID" : region["ids"][rows],
+        "Original Probability of Failure" : baseline["probability"][rows],
+        "Probability of Failure" : new_probability,
+        "Original Expected Loss Value" : baseline["expected"][rows],
+        "Expected Loss Value" : new_probability * total_loss,
+    })
+    return {
+        "region" : region["region"],
+        "dams" : dams.to_dict("records"),
+        "portfolio" : {key : float(value) for key, value in statistics.items()},
+        "portfolio_against_model_baseline" : {key : float(value) for key, value in model_statistics.items()},
+    }
+
+def _take_batch(requests : queue.Queue, first : tuple, window : float, max_rows : int) -> list:
+    #the first request plus whatever arrives within window, up to max_rows changed dams
+    batch = [first]
+    rows = len(first[1][0])
+    deadline = time.monotonic() + window
+    while rows < max_rows:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = requests.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is None:
+            requests.put(None)
+            break
+        batch.append(item)
+        rows += len(item[1][0])
+    return batch
+
+def _batch_loop(service : dict):
+    #the only thread that calls model.predict, one call per region for every batch
+    requests = service["requests"]
+    while True:
+        first = requests.get()
+        if first is None:
+            return
+        batch = _take_batch(requests, first, service["window"], service["max_rows"])
+        by_region = {}
+        for item in batch:
+            by_region.setdefault(item[0], []).append(item)
+        instrumentation.count("service.batches")
+        instrumentation.count("service.scenarios", len(batch))
+        for name, items in by_region.items():
+            region = service["regions"][name]
+            try:
+                with instrumentation.span("service.batch", region=name, scenarios=len(items)):
+                    changed = incremental_scoring.score_variants(region["baseline"], [variant for _, variant, _ in items])
+                for (_, (rows, _), future), new_probability in zip(items, changed):
+                    future.set_result(scenario_result(region, rows, new_probability))
+            except Exception as error:
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(error)
+
+def start(files : list = None, profile : str = model_factory.FINAL_PROFILE, initial_percentile : float = INITIAL_PERCENTILE, window : float = BATCH_WINDOW_SECONDS, max_rows : int = MAX_BATCH_ROWS) -> dict:
+    #loads every region and starts the batching thread, files defaults to parallel_regions.REGION_FILES
+    import parallel_regions
+    regions = {}
+    for file in files or parallel_regions.REGION_FILES:
+        region = load_region(file, profile, initial_percentile)
+        regions[region["region"]] = region
+    service = {"regions" : regions, "requests" : queue.Queue(), "window" : window, "max_rows" : max_rows}
+    service["thread"] = threading.Thread(target=_batch_loop, args=(service,), daemon=True)
+    service["thread"].start()
+    return service
+
+def stop(service : dict):
+    service["requests"].put(None)
+    service["thread"].join()
+
+def submit(service : dict, scenario : dict) -> Future:
+    #queues one scenario {"region": name, "changes": [...]} and returns the future of its scenario_result
+    #bad scenarios fail straight away instead of reaching the batch
+    future = Future()
+    try:
+        name = scenario.get("region")
+        if name not in service["regions"]:
+            raise ValueError(f"unknown region {name!r}, the service has {list(service['regions'])}")
+        variant = scenario_variant(service["regions"][name], scenario.get("changes", []))
+    except Exception as error:
+        future.set_exception(error)
+        return future
+    service["requests"].put((name, variant, future))
+    return future
+
+def score(service : dict, scenarios : list) -> list:
+    #scenario_result for every scenario, submitted together so they share batches
+    futures = [submit(service, scenario) for scenario in scenarios]
+    return [future.result() for future in futures]
+
+def _handler(service : dict):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status : int, body : dict):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._reply(404, {"error" : f"no such path {self.path}"})
+            self._reply(200, {"regions" : {name : len(region["ids"]) for name, region in service["regions"].items()}})
+
+        def do_POST(self):
+            if self.path != "/score":
+                return self._reply(404, {"error" : f"no such path {self.path}"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if "scenarios" in request:
+                    return self._reply(200, {"results" : score(service, request["scenarios"])})
+                self._reply(200, score(service, [request])[0])
+            except (ValueError, KeyError, TypeError) as error:
+                self._reply(400, {"error" : str(error)})
+            except Exception as error:
+                #a failed prediction still gets an answer instead of a dropped connection
+                self._reply(500, {"error" : f"{type(error).__name__}: {error}"})
+
+        def log_message(self, format, *args):
+            pass
+    return Handler
+
+def serve(service : dict, host : str = HOST, port : int = PORT) -> ThreadingHTTPServer:
+    #http server on its own threads, every request thread waits on the shared batcher
+    server = ThreadingHTTPServer((host, port), _handler(service))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="What-if scoring of assessment and inspection frequency changes")
+    parser.add_argument("files", nargs="*", default=None)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--profile", default=model_factory.FINAL_PROFILE, choices=list(model_factory.PROFILES))
+    parser.add_argument("--initial-percentile", type=float, default=INITIAL_PERCENTILE)
+    args = parser.parse_args()
+
+    import ydf
+    ydf.verbose(0)
+    service = start(args.files or None, args.profile, args.initial_percentile)
+    server = serve(service, args.host, args.port)
+    print(f"Scoring {', '.join(service['regions'])} on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        stop(service)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import dam_dataset
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dam_data_imputed_flumevale.csv")
+
+def _memmap_base(values : np.ndarray):
+    while values is not None and not isinstance(values, np.memmap):
+        values = values.base
+    return values
+
+def _load(source : str, directory : str, times : int) -> int:
+    rows = 0
+    for _ in range(times):
+        rows = len(dam_dataset.load_dam_data(source, directory=directory))
+    return rows
+
+def test_numeric_columns_are_memory_mapped(tmp_path):
+    df = dam_dataset.load_dam_data(SOURCE, directory=str(tmp_path))
+    assert isinstance(_memmap_base(df["Expected Loss Value"].to_numpy()), np.memmap)
+    pd.testing.assert_frame_equal(df.astype({column : str for column in dam_dataset.CATEGORICAL_COLUMNS}), pd.read_csv(SOURCE, dtype=dam_dataset._READ_DTYPES))
+
+def test_rebuilds_do_not_break_concurrent_loads(tmp_path):
+    source = str(tmp_path / "dam_data_imputed_flumevale.csv")
+    shutil.copy(SOURCE, source)
+    directory = str(tmp_path / "cache")
+    dam_dataset.load_dam_data(source, directory=directory)
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(_load, source, directory, 40) for _ in range(4)]
+        for step in range(20):
+            #a new mtime makes the next load rebuild the cache
+            os.utime(source, ns=(step, step))
+            dam_dataset.build_cache(source, directory)
+        assert [future.result() for future in futures] == [3522] * 4
+    target = dam_dataset.cache_path(source, directory)
+    assert sorted(os.listdir(target)) == sorted([dam_dataset.CURRENT_FILE, dam_dataset.LOCK_FILE, os.path.basename(dam_dataset._current_version(target))])
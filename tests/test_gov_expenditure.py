@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+import gov_expenditure
+
+def _frame() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    probability = rng.uniform(0, 0.1, 200)
+    total_loss = rng.uniform(0, 50, 200)
+    return pd.DataFrame({"Probability of Failure" : probability, "Total Loss Given Failure" : total_loss, "Expected Loss Value" : probability * total_loss})
+
+def test_frame_moments_match_portfolio_moments():
+    df = _frame()
+    columns = [df[column].to_numpy() for column in ("Probability of Failure", "Total Loss Given Failure", "Expected Loss Value")]
+    for lower, upper, top in [(0, 100, None), (40, 50, None), (90, 100, None), (0, 100, 25)]:
+        banded = gov_expenditure.frame_moments(df, lower, upper, top)
+        expected = gov_expenditure.portfolio_moments(*columns, lower, upper, top)
+        np.testing.assert_array_equal(banded["rows"], expected["rows"])
+        for key in ["count", "total_loss", "expected_value", "variance"]:
+            assert np.isclose(banded[key], expected[key], rtol=1e-12)
+
+def test_band_index_is_reused_until_the_frame_changes():
+    df = _frame()
+    index = gov_expenditure.band_index(df)
+    assert gov_expenditure.band_index(df) is index
+    df.loc[3, "Expected Loss Value"] = 100.0
+    assert gov_expenditure.band_index(df) is not index
+    assert gov_expenditure.frame_moments(df, top=1)["rows"].tolist() == [3]
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+from sklearn.impute import KNNImputer
+import imputation
+
+@pytest.mark.parametrize("tree_min_rows", [1, 10 ** 9])
+def test_impute_partition_matches_knn_imputer(monkeypatch, tree_min_rows):
+    #tree_min_rows=1 searches every pattern with a tree, 10 ** 9 compares every row directly
+    monkeypatch.setattr(imputation, "TREE_MIN_ROWS", tree_min_rows)
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(400, 6))
+    data[:, 0] = rng.integers(0, 3, 400)
+    data[:, 3:][rng.random((400, 3)) < 0.3] = np.nan
+    #a row sharing nothing with the donors missing its only feature, and a column nobody has
+    data[0] = [np.nan, np.nan, np.nan, np.nan, 0.5, np.nan]
+    data = np.column_stack([data, np.full(400, np.nan)])
+    expected = KNNImputer(n_neighbors=5, weights="uniform", keep_empty_features=True).fit_transform(data)
+    np.testing.assert_allclose(imputation._impute_partition(data, 5), expected, rtol=1e-12, atol=1e-12)
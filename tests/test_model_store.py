@@ -0,0 +1,13 @@
+import pandas as pd
+import model_store
+
+def _frame() -> pd.DataFrame:
+    return pd.DataFrame({"ID" : ["a", "b", "c"], "Height (m)" : [1.0, 2.0, 3.0], "Loss" : [4.0, 5.0, 6.0], "Probability of Failure" : [0.1, 0.2, 0.3]})
+
+def test_fingerprint_ignores_dropped_columns():
+    df = _frame()
+    key = model_store.fingerprint(df, ["ID", "Loss"], "Probability of Failure", {})
+    edited = df.assign(ID=["x", "y", "z"], Loss=[0.0, 0.0, 0.0])
+    assert model_store.fingerprint(edited, ["ID", "Loss"], "Probability of Failure", {}) == key
+    edited["Height (m)"] += 1
+    assert model_store.fingerprint(edited, ["ID", "Loss"], "Probability of Failure", {}) != key
@@ -0,0 +1,45 @@
+import pytest
+import instrumentation
+import parallel_regions
+
+def _work(value : int) -> int:
+    with instrumentation.span("work"):
+        return value * 2
+
+@pytest.fixture
+def traced():
+    instrumentation.reset()
+    instrumentation.enable(None)
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+def _names(events : list) -> dict:
+    names = {}
+    for event in events:
+        names[event["name"]] = names.get(event["name"], 0) + 1
+    return names
+
+def test_traced_run_tasks_returns_each_event_once(traced):
+    with instrumentation.span("parent.before"):
+        pass
+    assert parallel_regions.run_tasks(_work, [(1,), (2,)], workers=2, threads_per_worker=1) == [2, 4]
+    assert parallel_regions.run_tasks(_work, [(3,), (4,)], workers=2, threads_per_worker=1) == [6, 8]
+    names = _names(instrumentation.collect())
+    assert names == {"parent.before" : 1, "work" : 4, "parallel_regions.task" : 4}
+
+def test_export_without_trace_file(traced):
+    with pytest.raises(ValueError):
+        instrumentation.export()
+
+def _limits() -> tuple:
+    import os
+    import model_store
+    return os.environ.get("OMP_NUM_THREADS"), model_store.NUM_THREADS
+
+def test_in_process_run_restores_thread_limits(monkeypatch):
+    import model_store
+    monkeypatch.delenv("OMP_NUM_THREADS", raising=False)
+    monkeypatch.setattr(model_store, "NUM_THREADS", None)
+    assert parallel_regions.run_tasks(_limits, [()], workers=1, threads_per_worker=3) == [("3", 3)]
+    assert _limits() == (None, None)
@@ -0,0 +1,26 @@
+import policy_solver
+
+def _solver(mode : str, response) -> dict:
+    #a solver whose threshold percent is response(setting) instead of a model's prediction
+    return {"mode" : mode, "region" : "Test", "initial_percentile" : 95, "memo" : {}, "evaluations" : 0, "response" : response}
+
+def _evaluate(solver : dict, setting : float) -> dict:
+    if setting not in solver["memo"]:
+        solver["evaluations"] += 1
+        solver["memo"][setting] = {"Threshold percent Test" : solver["response"](setting)}
+    return solver["memo"][setting]
+
+def test_whole_settings_find_the_first_of_two_crossings(monkeypatch):
+    monkeypatch.setattr(policy_solver, "evaluate", _evaluate)
+    #reaches 97% at 1, drops back below it and reaches it again from 5 on, the coarse scan only sees 0, 5 and 10
+    values = {0 : 0.95, 1 : 0.971, 2 : 0.95, 3 : 0.95, 4 : 0.95}
+    solver = _solver("minimum", lambda setting: values.get(setting, 0.975))
+    result = policy_solver.solve(solver, target_percentile=97, scan_points=3)
+    assert result["setting"] == 1
+
+def test_fractional_settings_find_the_first_of_two_crossings(monkeypatch):
+    monkeypatch.setattr(policy_solver, "evaluate", _evaluate)
+    #reached on [1.15, 1.3] and again from 1.6, bisecting (1, 1.75] would step over the first crossing
+    solver = _solver("multiplier", lambda setting: 0.975 if 1.15 <= setting <= 1.3 or setting >= 1.6 else 0.95)
+    result = policy_solver.solve(solver, target_percentile=97, tolerance=0.01)
+    assert 1.15 <= result["setting"] <= 1.16
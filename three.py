@@ -7,41 +7,23 @@ import os
 import seaborn as sns
 sns.set_style("whitegrid")
 
+import dam_dataset
+import risk_layers
+
 # Simulate claim sizes (in million £)
-claim_sizes = np.linspace(0, 100, 1000)  # From 0 to 100M £
-
-# Define cost functions
-def insurer_cost(claim_size):
-    # Direct insurers: Lower cost per claim, high frequency, slight increase until spike
-    base_cost = 0.05 * claim_size  # Linear base cost
-    spike_threshold = 1  # £1M threshold where cost spikes
-    if claim_size <= spike_threshold:
-        return base_cost
-    else:
-        return base_cost + 0.5 * (claim_size - spike_threshold)**2  # Quadratic spike after threshold
-
-def reinsurer_cost(claim_size):
-    # Reinsurers: Higher cost per claim, lower frequency, steeper curve
-    base_cost = 0.2 * claim_size  # Steeper linear base cost
-    sustainable_threshold = 50  # £50M threshold where cost becomes unsustainable
-    if claim_size <= sustainable_threshold:
-        return base_cost
-    else:
-        return base_cost + 0.8 * (claim_size - sustainable_threshold)**2  # Steeper spike after threshold
-
-# Vectorize cost functions for numpy array
-insurer_costs = np.array([insurer_cost(x) for x in claim_sizes])
-reinsurer_costs = np.array([reinsurer_cost(x) for x in claim_sizes])
+claim_sizes = np.linspace(0, risk_layers.MAX_CLAIM_SIZE, 1000)  # From 0 to 100M £
+
+# Cost functions are vectorized in risk_layers, one call evaluates every claim size
+insurer_costs = risk_layers.insurer_cost(claim_sizes)
+reinsurer_costs = risk_layers.reinsurer_cost(claim_sizes)
 
 # Define sustainable cost limits (hypothetical, in million £)
-insurer_sustainable_limit = 1.0  # £1M sustainable cost limit for insurers
-reinsurer_sustainable_limit = 20.0  # £20M sustainable cost limit for reinsurers (adjusted for realism)
+insurer_sustainable_limit = risk_layers.INSURER_SUSTAINABLE_LIMIT  # £1M sustainable cost limit for insurers
+reinsurer_sustainable_limit = risk_layers.REINSURER_SUSTAINABLE_LIMIT  # £20M sustainable cost limit for reinsurers (adjusted for realism)
 
-# Find thresholds
-insurer_threshold_idx = np.argmax(insurer_costs > insurer_sustainable_limit)
-insurer_threshold = claim_sizes[insurer_threshold_idx] if insurer_threshold_idx > 0 else claim_sizes[-1]
-reinsurer_threshold_idx = np.argmax(reinsurer_costs > reinsurer_sustainable_limit)
-reinsurer_threshold = claim_sizes[reinsurer_threshold_idx] if reinsurer_threshold_idx > 0 else claim_sizes[-1]
+# Find thresholds by root finding on the cost curves rather than on the plotting grid
+layers = risk_layers.break_even_structure(insurer_sustainable_limit, reinsurer_sustainable_limit)
+insurer_threshold, reinsurer_threshold = layers["attachments"][1:]
 
 # Ensure output directory exists
 output_dir = "graphs"
@@ -93,4 +75,15 @@ print(summary_df)
 
 # Additional diagnostics
 print(f"\nInsurer Threshold: £{insurer_threshold:.1f}M")
-print(f"Reinsurer Threshold: £{reinsurer_threshold:.1f}M")
\ No newline at end of file
+print(f"Reinsurer Threshold: £{reinsurer_threshold:.1f}M")
+
+# Price the layers on the actual dam losses: every dam's Total Loss Given Failure is split into the three tranches
+# and weighted by its probability of failure
+# The whole imputed registry holds every dam once, the region files are splits of it
+registry_file = "dam_data_imputed_new_columns.csv"
+if os.path.exists(registry_file):
+    dams = dam_dataset.load_dam_data(registry_file, columns=["Probability of Failure", "Total Loss Given Failure"])
+    layer_table = risk_layers.layer_metrics(dams["Total Loss Given Failure"].to_numpy(), layers, dams["Probability of Failure"].to_numpy())
+    layer_table.to_csv(os.path.join(output_dir, "break_even_layers.csv"), index=False)
+    print("\nLayer Costs over the Dam Portfolio:")
+    print(layer_table[["layer", "attachment", "detachment", "expected_cost", "share_of_expected_loss", "probability_attached"]])